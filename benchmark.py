@@ -0,0 +1,174 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from data_quality import DataQualityIssues
+from generate_incidents import write_incidents_csv
+from incident_analysis import (
+    build_report_data,
+    fold_ticket,
+    new_aggregates,
+    read_incident_records,
+    write_cost_analysis_to_csv,
+    write_device_summary_to_csv,
+    write_incident_report,
+    write_incidents_by_site_to_csv,
+)
+
+
+# Reads and validates every row into IncidentRecords. The records are dropped as they
+# are read, nothing is kept that the streaming pipeline would not keep
+def stage_parse(state):
+    state["data_quality_issues"] = DataQualityIssues(state["network_incidents"])
+    for _ in read_incident_records(state["network_incidents"], state["data_quality_issues"]):
+        pass
+
+# One streamed pass like ticket_processor: reads and folds every ticket, then builds
+# every report section. run_benchmark subtracts the parse stage from its times, the
+# memory peak is that of the whole pass
+def stage_aggregate(state):
+    aggregates = new_aggregates()
+    for ticket in read_incident_records(state["network_incidents"], DataQualityIssues(state["network_incidents"])):
+        fold_ticket(aggregates, ticket)
+    state["data"] = build_report_data(aggregates)
+
+def stage_report(state):
+    write_incident_report(state["data"], os.path.join(state["output_dir"], "incident_analysis.txt"))
+
+def stage_incidents_by_site(state):
+    write_incidents_by_site_to_csv(state["data"], os.path.join(state["output_dir"], "incidents_by_site.csv"))
+
+def stage_device_summary(state):
+    write_device_summary_to_csv(state["data"], os.path.join(state["output_dir"], "problem_devices.csv"))
+
+def stage_cost_analysis(state):
+    write_cost_analysis_to_csv(state["data"], os.path.join(state["output_dir"], "cost_analysis.csv"))
+
+# Pipeline stages in the order they run, every stage uses what the earlier ones left in state
+stages = [
+    ("parse_and_validate", stage_parse),
+    ("aggregate", stage_aggregate),
+    ("render_incident_analysis", stage_report),
+    ("write_incidents_by_site_to_csv", stage_incidents_by_site),
+    ("write_device_summary_to_csv", stage_device_summary),
+    ("write_cost_analysis_to_csv", stage_cost_analysis),
+]
+
+
+# Runs one stage and measures wall time, CPU time and, optionally, peak Python memory.
+# tracemalloc slows the stage down, so timing and memory come from separate runs
+def measure_stage(stage, state, repeat, measure_memory):
+    wall_times = []
+    cpu_times = []
+    for _ in range(repeat):
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        stage(state)
+        cpu_times.append(time.process_time() - cpu_start)
+        wall_times.append(time.perf_counter() - wall_start)
+
+    result = {
+        "wall_seconds": min(wall_times),
+        "cpu_seconds": min(cpu_times),
+        "rows_per_second": state["rows"] / min(wall_times) if min(wall_times) else None,
+    }
+
+    if measure_memory:
+        tracemalloc.start()
+        stage(state)
+        result["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return result
+
+def run_benchmark(network_incidents, rows, repeat=3, measure_memory=True):
+    with tempfile.TemporaryDirectory() as output_dir:
+        state = {"network_incidents": network_incidents, "output_dir": output_dir, "rows": rows}
+        results = {}
+        for name, stage in stages:
+            results[name] = measure_stage(stage, state, repeat, measure_memory)
+        results["parse_and_validate"]["rejected_rows"] = state["data_quality_issues"].rejected_rows
+
+    # The aggregate stage parses the file again, what is left after the parse stage is aggregation
+    parse, aggregate = results["parse_and_validate"], results["aggregate"]
+    for key in ("wall_seconds", "cpu_seconds"):
+        aggregate[key] = max(aggregate[key] - parse[key], 0.0)
+    aggregate["rows_per_second"] = rows / aggregate["wall_seconds"] if aggregate["wall_seconds"] else None
+    return results
+
+# Short commit id of the code being measured, so results from different versions can be told apart
+def current_version():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+# Prints the stages side by side with an earlier result file, slower stages are flagged.
+# Earlier times are scaled to the current row count so runs of different sizes can be compared
+def print_comparison(results, baseline_file):
+    with open(baseline_file, encoding="utf-8") as file:
+        baseline = json.load(file)
+
+    scale = results["rows"] / baseline["rows"]
+    print(f"Jämför med {baseline['version']} ({baseline['rows']} rader)")
+    print(f"{'Steg'.ljust(34)}{'Före (s)'.rjust(10)}{'Nu (s)'.rjust(10)}{'Kvot'.rjust(8)}")
+    for name, stage_result in results["stages"].items():
+        before = baseline["stages"].get(name, {}).get("wall_seconds")
+        if not before:
+            continue
+        before *= scale
+        ratio = stage_result["wall_seconds"] / before
+        flag = "  ⚠" if ratio > 1.10 else ""
+        print(f"{name.ljust(34)}{before:10.3f}{stage_result['wall_seconds']:10.3f}{ratio:8.2f}{flag}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mäter tid och minne för varje steg i incidentanalysen.")
+    parser.add_argument("--rows", type=int, default=10000, help="Antal rader i den genererade filen")
+    parser.add_argument("--input", help="Befintlig CSV-fil att mäta på i stället för en genererad")
+    parser.add_argument("--seed", type=int, default=42, help="Slumpfrö för den genererade filen")
+    parser.add_argument("--malformed", type=float, default=0.01, help="Andel trasiga rader i den genererade filen")
+    parser.add_argument("--repeat", type=int, default=3, help="Antal körningar per steg, den snabbaste räknas")
+    parser.add_argument("--no-memory", action="store_true", help="Hoppa över minnesmätningen med tracemalloc")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON-fil som resultaten skrivs till")
+    parser.add_argument("--compare", help="Tidigare resultatfil att jämföra med")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as input_dir:
+        if args.input:
+            network_incidents = args.input
+            with open(network_incidents, encoding="utf-8") as file:
+                rows = sum(1 for _ in file) - 1
+        else:
+            network_incidents = os.path.join(input_dir, "network_incidents.csv")
+            rows = args.rows
+            write_incidents_csv(network_incidents, rows, seed=args.seed, malformed_share=args.malformed)
+
+        results = {
+            "version": current_version(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "rows": rows,
+            "input_bytes": os.path.getsize(network_incidents),
+            "seed": None if args.input else args.seed,
+            "stages": run_benchmark(network_incidents, rows, args.repeat, not args.no_memory),
+        }
+
+    with open(args.output, mode="w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+
+    for name, stage_result in results["stages"].items():
+        memory = f"{stage_result['peak_memory_bytes'] / 1024 / 1024:8.1f} MiB" if "peak_memory_bytes" in stage_result else ""
+        print(f"{name.ljust(34)}{stage_result['wall_seconds']:8.3f} s {memory}")
+
+    if args.compare:
+        print()
+        print_comparison(results, args.compare)
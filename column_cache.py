@@ -0,0 +1,167 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Binary cache of the validated incident columns, so a file that has been parsed once is
+# memory-mapped on later runs instead of being read as csv again.
+#
+# File layout, all numbers little-endian:
+#   magic (8 bytes) | header length (uint64) | JSON header | padding | arrays
+# The header holds the source key, the row count, where every array starts and the
+# dictionaries for the low-cardinality string columns (site, device, severity, category),
+# which are stored as int32 codes. ticket_id and cost_sek are almost unique per row and
+# are stored as one utf-8 blob with an int64 offset array instead
+
+cache_magic = b"INCCOLS\x00"
+
+# Bumped whenever the layout or the columns change so old cache files are rebuilt
+cache_format = 3
+
+# Arrays start on this boundary so they can be mapped without copying
+cache_alignment = 64
+
+# Bytes hashed from the start and the end of the source file
+source_sample_size = 64 * 1024
+
+# Columns stored as fixed-width arrays and their types
+numeric_columns = {
+    "week_number": "<i4",
+    "site": "<i4",
+    "device_hostname": "<i4",
+    "severity": "<i4",
+    "category": "<i4",
+    "resolution_minutes": "<i8",
+    "affected_users": "<i8",
+    "cost_ore": "<i8",
+    "impact_score": "<f8",
+}
+
+string_columns = ["ticket_id", "cost_sek"]
+
+dictionary_columns = ["site_names", "device_names", "severity_names", "category_names"]
+
+
+# Identifies the version of the source file the cache was built from: size, mtime and a
+# sha256 of the first and last block. Hashing the whole file would take longer than
+# reading the cache, so rewrites that keep size, mtime and both ends are not detected
+def source_key(network_incidents):
+    status = os.stat(network_incidents)
+    checksum = hashlib.sha256()
+    with open(network_incidents, mode="rb") as file:
+        checksum.update(file.read(source_sample_size))
+        file.seek(max(0, status.st_size - source_sample_size))
+        checksum.update(file.read(source_sample_size))
+    return {"size": status.st_size, "mtime_ns": status.st_mtime_ns, "sha256": checksum.hexdigest()}
+
+# One cache file per source file, named after its absolute path
+def cache_path(network_incidents, cache_dir):
+    name = hashlib.sha256(os.path.abspath(network_incidents).encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, f"{name}.cols")
+
+# Reads the column strings of a cache file without copying them until a row is asked for
+class StringColumn:
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row):
+        return self.blob[self.offsets[row]:self.offsets[row + 1]].tobytes().decode("utf-8")
+
+# Returns (columns, data_quality_issues as a dict) from the cache, or None if there is no cache file
+# for this source or it was built from another version of it
+def load_columns(network_incidents, cache_dir):
+    try:
+        with open(cache_path(network_incidents, cache_dir), mode="rb") as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    if mapped[:len(cache_magic)] != cache_magic:
+        return None
+    header_start = len(cache_magic) + 8
+    try:
+        header_length, = struct.unpack_from("<Q", mapped, len(cache_magic))
+        header = json.loads(mapped[header_start:header_start + header_length])
+    except (struct.error, ValueError):
+        return None
+
+    if header.get("format") != cache_format or header.get("source") != source_key(network_incidents):
+        return None
+
+    # Every array is a view of the mapped file, pages are only read when they are used
+    columns = {}
+    try:
+        for name, layout in header["arrays"].items():
+            columns[name] = np.frombuffer(mapped, dtype=layout["dtype"], count=layout["count"], offset=layout["offset"])
+    except ValueError:
+        return None
+    for name in string_columns:
+        columns[name] = StringColumn(columns.pop(f"{name}_offsets"), memoryview(columns.pop(f"{name}_blob")))
+    for name in dictionary_columns:
+        columns[name] = header["dictionaries"][name]
+
+    return columns, header["data_quality_issues"]
+
+# Writes the columns from load_incident_columns and the data quality issues (as a dict) to
+# the cache. key is the source_key taken before the file was parsed, so a file that changed
+# while being read is parsed again next time
+def save_columns(network_incidents, cache_dir, columns, data_quality_issues, key):
+    arrays = {}
+    for name, dtype in numeric_columns.items():
+        arrays[name] = np.ascontiguousarray(columns[name], dtype=dtype)
+    for name in string_columns:
+        encoded = [value.encode("utf-8") for value in columns[name]]
+        offsets = np.zeros(len(encoded) + 1, dtype="<i8")
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        arrays[f"{name}_offsets"] = offsets
+        arrays[f"{name}_blob"] = np.frombuffer(b"".join(encoded), dtype="u1")
+
+    header = {
+        "format": cache_format,
+        "source": key,
+        "rows": len(columns["cost_ore"]),
+        "arrays": {},
+        "dictionaries": {name: list(columns[name]) for name in dictionary_columns},
+        "data_quality_issues": data_quality_issues,
+    }
+
+    # The array offsets are part of the header, so the arrays are placed after a guessed
+    # header length that grows until the encoded header fits in front of them
+    header_start = len(cache_magic) + 8
+    data_start = align(header_start + len(json.dumps(header, ensure_ascii=False).encode("utf-8")))
+    while True:
+        offset = data_start
+        for name, array in arrays.items():
+            header["arrays"][name] = {"dtype": array.dtype.str, "count": len(array), "offset": offset}
+            offset = align(offset + array.nbytes)
+        encoded_header = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        if header_start + len(encoded_header) <= data_start:
+            break
+        data_start = align(header_start + len(encoded_header))
+
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_file = cache_path(network_incidents, cache_dir)
+    temporary_file = f"{cache_file}.tmp"
+    with open(temporary_file, mode="wb") as file:
+        file.write(cache_magic)
+        file.write(struct.pack("<Q", len(encoded_header)))
+        file.write(encoded_header)
+        for name, array in arrays.items():
+            file.write(b"\0" * (header["arrays"][name]["offset"] - file.tell()))
+            file.write(array.tobytes())
+    os.replace(temporary_file, cache_file)
+
+def align(offset):
+    return -(-offset // cache_alignment) * cache_alignment
@@ -0,0 +1,106 @@
+import csv
+import os
+
+# Collects the rows rejected by validation in incident_analysis.py. Every rejected row is
+# counted per rule, but only the first few rows of every rule are kept as examples, so
+# memory and the report stay small no matter how dirty the input is. All rejected rows can
+# also be streamed to a reject file as they are found
+
+# Examples kept per rule
+sample_limit = 5
+
+# Columns written before the original values of a rejected row
+reject_fieldnames = ["source_file", "line_number", "rule", "field", "value"]
+
+
+class DataQualityIssues:
+
+    def __init__(self, source_file=None, reject_file=None):
+        self.source_file = source_file
+        self.reject_file = reject_file
+        self.fieldnames = None
+        self.rule_counts = {}
+        self.samples = {}
+        self.messages = []
+        self.reject_handle = None
+        self.reject_writer = None
+
+    # Records a row that broke a rule. line_number is the line in source_file where the row starts
+    def record(self, rule, line_number, field, value, row):
+        count = self.rule_counts.get(rule, 0)
+        self.rule_counts[rule] = count + 1
+        if count < sample_limit:
+            self.samples.setdefault(rule, []).append({"source_file": self.source_file, "line_number": line_number, "field": field, "value": value})
+
+        if self.reject_file is not None:
+            if self.reject_writer is None:
+                self.reject_handle = open(self.reject_file, mode="w", encoding="utf-8", newline="")
+                self.reject_writer = csv.writer(self.reject_handle)
+            self.reject_writer.writerow([self.source_file, line_number, rule, field, value] + row)
+
+    # Problems that concern a whole file rather than a row
+    def add_message(self, message):
+        self.messages.append(message)
+
+    @property
+    def rejected_rows(self):
+        return sum(self.rule_counts.values())
+
+    def __len__(self):
+        return self.rejected_rows + len(self.messages)
+
+    # Adds the issues of input that follows everything already added
+    def merge(self, other):
+        if self.fieldnames is None:
+            self.fieldnames = other.fieldnames
+        for rule, count in other.rule_counts.items():
+            self.rule_counts[rule] = self.rule_counts.get(rule, 0) + count
+            samples = self.samples.setdefault(rule, [])
+            samples.extend(other.samples.get(rule, [])[:sample_limit - len(samples)])
+        self.messages.extend(other.messages)
+
+    def copy(self):
+        issues = DataQualityIssues(self.source_file)
+        issues.merge(self)
+        return issues
+
+    def close(self):
+        if self.reject_handle is not None:
+            self.reject_handle.close()
+            self.reject_handle = None
+            self.reject_writer = None
+
+    # The open reject file stays with the process that wrote it
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["reject_handle"] = None
+        state["reject_writer"] = None
+        return state
+
+    # Plain dict for JSON files such as the column cache
+    def as_dict(self):
+        return {"fieldnames": self.fieldnames, "rule_counts": self.rule_counts, "samples": self.samples, "messages": self.messages}
+
+    @classmethod
+    def from_dict(cls, issues_dict, source_file=None):
+        issues = cls(source_file)
+        issues.fieldnames = issues_dict["fieldnames"]
+        issues.rule_counts = issues_dict["rule_counts"]
+        issues.samples = issues_dict["samples"]
+        issues.messages = issues_dict["messages"]
+        return issues
+
+# Joins the reject files written for every input file, in input order, into one csv file
+# with a header. The parts are removed afterwards
+def write_reject_file(reject_file, reject_parts, fieldnames):
+    temporary_file = f"{reject_file}.tmp"
+    with open(temporary_file, mode="w", encoding="utf-8", newline="") as output:
+        csv.writer(output).writerow(reject_fieldnames + list(fieldnames or []))
+        for reject_part in reject_parts:
+            if not os.path.exists(reject_part):
+                continue
+            with open(reject_part, encoding="utf-8", newline="") as part:
+                for chunk in iter(lambda: part.read(1024 * 1024), ""):
+                    output.write(chunk)
+            os.remove(reject_part)
+    os.replace(temporary_file, reject_file)
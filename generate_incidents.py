@@ -0,0 +1,171 @@
+import argparse
+import csv
+import random
+
+from swedish_numbers import format_ore
+
+
+# Same columns as network_incidents.csv
+fieldnames = [
+    "ticket_id",
+    "week_number",
+    "site",
+    "device_hostname",
+    "severity",
+    "category",
+    "description",
+    "reported_by",
+    "resolution_minutes",
+    "affected_users",
+    "cost_sek",
+    "impact_score",
+    "resolution_notes"
+]
+
+# The real sites come first, more sites are numbered after them
+known_sites = [("Huvudkontor", "HQ"), ("Lager", "LAGER"), ("Datacenter", "DC"), ("Kontor Malmö", "MAL"), ("Säkerhetskopia", "DR")]
+
+device_prefixes = ["SW-", "AP-", "RT-", "FW-", "LB-"]
+device_prefix_weights = [40, 30, 12, 12, 6]
+
+severities = ["critical", "high", "medium", "low"]
+severity_weights = [12, 25, 38, 25]
+
+# Resolution time and cost ranges per severity, bigger incidents take longer and cost more
+severity_profiles = {
+    "critical": {"resolution_minutes": (90, 480), "cost": (8000, 60000), "impact_score": (7.5, 10.0)},
+    "high": {"resolution_minutes": (45, 240), "cost": (3000, 25000), "impact_score": (5.5, 9.0)},
+    "medium": {"resolution_minutes": (20, 150), "cost": (800, 9000), "impact_score": (3.5, 7.0)},
+    "low": {"resolution_minutes": (5, 90), "cost": (150, 3500), "impact_score": (1.0, 4.5)},
+}
+
+categories = ["connectivity", "hardware", "performance", "security", "wifi"]
+
+reporters = ["Anna Andersson", "Björn Björnsson", "Cecilia Carlsson", "David Davidsson", "Erik Eriksson"]
+
+descriptions = {
+    "connectivity": "Port down causing network connectivity issues",
+    "hardware": "Power supply failure on device",
+    "performance": "High latency and packet loss during business hours",
+    "security": "Blocked intrusion attempt triggered firewall alarms",
+    "wifi": "WiFi outage in part of the building",
+}
+
+resolution_notes = {
+    "connectivity": "Replaced faulty ethernet cable",
+    "hardware": "Replaced power supply unit",
+    "performance": "Adjusted QoS policy and rebalanced traffic",
+    "security": "Updated firewall rules and rotated credentials",
+    "wifi": "Access point reboot resolved the issue",
+}
+
+# Kinds of broken rows that validation in incident_analysis.py should reject
+malformed_kinds = ["week_number", "cost_sek", "impact_score", "resolution_minutes"]
+
+# Number of rows written per writerows call
+batch_size = 10000
+
+
+# Creates the sites and the devices at every site. Hostnames follow the repo's own
+# pattern: type prefix, site abbreviation and a number, e.g. SW-DC-03
+def build_sites(site_count, devices_per_site, rng):
+    sites = []
+    for site_number in range(site_count):
+        if site_number < len(known_sites):
+            site, abbreviation = known_sites[site_number]
+        else:
+            site, abbreviation = f"Kontor {site_number + 1:03d}", f"K{site_number + 1:03d}"
+
+        devices = []
+        for device_number in range(devices_per_site):
+            prefix = rng.choices(device_prefixes, device_prefix_weights)[0]
+            devices.append(f"{prefix}{abbreviation}-{device_number + 1:02d}")
+        sites.append((site, devices))
+    return sites
+
+# Breaks one field of a row the way real exports tend to be broken
+def make_malformed(row, rng):
+    kind = rng.choice(malformed_kinds)
+    if kind == "week_number":
+        row[1] = rng.choice(["v." + row[1], "0", "54", ""])
+    elif kind == "cost_sek":
+        row[10] = rng.choice(["okänd", "12,34,56", ""])
+    elif kind == "impact_score":
+        row[11] = rng.choice(["hög", "n/a", ""])
+    else:
+        row[8] = rng.choice(["", "cirka 30"])
+    return row
+
+# Yields generated rows as lists in the column order of fieldnames
+def generate_rows(row_count, seed=42, site_count=25, devices_per_site=20, first_week=1, last_week=52, malformed_share=0.0, year=2024):
+    rng = random.Random(seed)
+    sites = build_sites(site_count, devices_per_site, rng)
+
+    for number in range(1, row_count + 1):
+        site, devices = rng.choice(sites)
+        severity = rng.choices(severities, severity_weights)[0]
+        category = rng.choice(categories)
+        profile = severity_profiles[severity]
+
+        cost_ore = rng.randint(profile["cost"][0] * 100, profile["cost"][1] * 100)
+        # Some tickets have no affected users recorded, like in the real export
+        affected_users = "" if rng.random() < 0.02 else str(int(rng.expovariate(1 / 40)))
+
+        row = [
+            f"TECH-{year}-{number:03d}",
+            str(rng.randint(first_week, last_week)),
+            site,
+            rng.choice(devices),
+            severity,
+            category,
+            descriptions[category],
+            rng.choice(reporters),
+            str(rng.randint(*profile["resolution_minutes"])),
+            affected_users,
+            format_ore(cost_ore),
+            f"{rng.uniform(*profile['impact_score']):.1f}",
+            resolution_notes[category]
+        ]
+
+        if malformed_share and rng.random() < malformed_share:
+            row = make_malformed(row, rng)
+
+        yield row
+
+# Streams the generated rows to a csv file in batches, so 50M rows use as little memory as 10k
+def write_incidents_csv(output_filename, row_count, **options):
+    with open(output_filename, mode="w", encoding="utf-8", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(fieldnames)
+
+        batch = []
+        for row in generate_rows(row_count, **options):
+            batch.append(row)
+            if len(batch) == batch_size:
+                writer.writerows(batch)
+                batch.clear()
+        writer.writerows(batch)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Skapar syntetiska incidentfiler i samma format som network_incidents.csv.")
+    parser.add_argument("output", help="CSV-fil som skapas")
+    parser.add_argument("--rows", type=int, default=10000, help="Antal rader (standard 10000)")
+    parser.add_argument("--seed", type=int, default=42, help="Slumpfrö, samma frö ger samma fil")
+    parser.add_argument("--sites", type=int, default=25, help="Antal sites")
+    parser.add_argument("--devices-per-site", type=int, default=20, help="Antal enheter per site")
+    parser.add_argument("--first-week", type=int, default=1, help="Första veckonummer")
+    parser.add_argument("--last-week", type=int, default=52, help="Sista veckonummer")
+    parser.add_argument("--malformed", type=float, default=0.0, help="Andel trasiga rader, t.ex. 0.01")
+    args = parser.parse_args()
+
+    write_incidents_csv(
+        args.output,
+        args.rows,
+        seed=args.seed,
+        site_count=args.sites,
+        devices_per_site=args.devices_per_site,
+        first_week=args.first_week,
+        last_week=args.last_week,
+        malformed_share=args.malformed
+    )
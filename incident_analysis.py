@@ -0,0 +1,1911 @@
+import argparse
+import csv
+import glob
+import hashlib
+import heapq
+import io
+import math
+import os
+import pickle
+import sys
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import chain, repeat
+
+import column_cache
+import instrumentation
+from data_quality import DataQualityIssues, write_reject_file
+from report_export import run_exports, table_formats, write_output, write_table
+from swedish_numbers import format_ore, parse_ore
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Severity order added going from highest to lowest
+severity_order = ["critical", "high", "medium", "low"]
+
+# Weights used to calculate the average severity score per device
+severity_scores = {"critical": 4, "high": 3, "medium": 2, "low": 1}
+
+# Number of expensive incidents kept for the report
+top_expensive_limit = 5
+
+# Resolution time percentiles shown in the report, estimated with a QuantileSketch
+resolution_percentiles = (0.5, 0.9, 0.99)
+
+# Relative error of the quantile sketches and the most buckets one sketch may use
+quantile_relative_accuracy = 0.01
+quantile_max_buckets = 2048
+
+# Weeks kept per device by the RecurrenceWindow, ending with the latest week in the input.
+# At least 2, the trend and last week's warnings need two weeks
+recurrence_window_weeks = 4
+
+# A device is recurring when it has incidents in at least recurrence_min_weeks weeks of
+# the window and either averages recurrence_rate incidents a week or is trending upwards
+recurrence_min_weeks = 2
+recurrence_rate = 0.75
+
+# Aggregate groups that can be computed independently of each other
+aggregate_groups = ("totals", "weeks", "top_expensive", "high_impact", "sites", "index", "device_counts", "devices", "recurrence", "categories", "weekly")
+
+# Bumped whenever the aggregate state changes so old checkpoints are rebuilt
+checkpoint_format = 9
+
+# Bytes read at a time when the processed part of a file is checksummed
+fingerprint_block_size = 1024 * 1024
+
+# Bytes before the read offset checksummed for the quick check that a file was only appended to
+tail_block_size = 64 * 1024
+
+# Bytes decoded at a time when a whole csv file is read
+read_block_size = 1024 * 1024
+
+
+# Reads the incidents and returns the data dict for the requested report sections (all by
+# default). With keep_tickets the IncidentIndex in data["incident_index"] also answers
+# drill-down queries. IncidentReport gives the same data lazily, one section at a time.
+# With a cache_dir the numpy backend keeps the parsed columns there, see column_cache.py.
+# With a reject_file every rejected row is also written to that csv file. recurrence_weeks
+# is the length of the RecurrenceWindow that flags recurring devices
+def ticket_processor(network_incidents, backend="python", workers=1, keep_tickets=False, sections=None, cache_dir=None, reject_file=None, recurrence_weeks=recurrence_window_weeks):
+    sections = list(report_sections) if sections is None else sections
+    with instrumentation.active.stage("aggregate"):
+        aggregates, data_quality_issues = aggregate_incidents(network_incidents, backend, workers, keep_tickets, section_groups(sections), cache_dir, reject_file, recurrence_weeks)
+    count_incidents(aggregates, data_quality_issues)
+
+    if not aggregates["ticket_count"]:
+        data_quality_issues.add_message("Inga giltiga rader kunde läsas in från CSV-filen.")
+        return {"data_quality_issues": data_quality_issues}
+
+    with instrumentation.active.stage("build_report_data"):
+        data = build_report_data(aggregates, sections)
+    data["data_quality_issues"] = data_quality_issues
+    return data
+
+# Counts valid and rejected rows when instrumentation is enabled
+def count_incidents(aggregates, data_quality_issues):
+    instrumentation.active.count("valid_rows", aggregates["ticket_count"])
+    instrumentation.active.count("rejected_rows", data_quality_issues.rejected_rows)
+
+# Accepts a csv file, a directory of csv files, a glob pattern or a list of these. With more than one
+# file and worker every file is parsed in its own process and the partial aggregates
+# are merged in file order, giving the same result as one sequential run
+def aggregate_incidents(network_incidents, backend="python", workers=1, keep_tickets=False, groups=aggregate_groups, cache_dir=None, reject_file=None, recurrence_weeks=recurrence_window_weeks):
+    incident_files = find_incident_files(network_incidents)
+    aggregates = new_aggregates(keep_tickets, groups, recurrence_weeks)
+    data_quality_issues = DataQualityIssues()
+
+    # Every file writes its rejected rows to a part of its own, joined in file order afterwards
+    if reject_file is not None:
+        reject_parts = [f"{reject_file}.{number}.part" for number in range(len(incident_files))]
+    else:
+        reject_parts = [None] * len(incident_files)
+
+    if workers > 1 and len(incident_files) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for partial_aggregates, partial_issues in executor.map(aggregate_incident_file, incident_files, repeat(backend), repeat(keep_tickets), repeat(groups), repeat(cache_dir), reject_parts, repeat(recurrence_weeks)):
+                merge_aggregates(aggregates, partial_aggregates)
+                data_quality_issues.merge(partial_issues)
+    else:
+        for incident_file, reject_part in zip(incident_files, reject_parts):
+            partial_aggregates, partial_issues = aggregate_incident_file(incident_file, backend, keep_tickets, groups, cache_dir, reject_part, recurrence_weeks)
+            merge_aggregates(aggregates, partial_aggregates)
+            data_quality_issues.merge(partial_issues)
+
+    if reject_file is not None:
+        write_reject_file(reject_file, reject_parts, data_quality_issues.fieldnames)
+
+    return aggregates, data_quality_issues
+
+# Incremental mode for a single append-only file. The aggregate state is saved to a
+# checkpoint together with how far the file has been read, so later runs only parse
+# the new rows. A rewritten file, an old checkpoint or one with another recurrence window
+# falls back to a full rebuild
+def incremental_ticket_processor(network_incidents, checkpoint_file, recurrence_weeks=recurrence_window_weeks):
+    checkpoint, checksum = load_checkpoint(checkpoint_file, network_incidents, recurrence_weeks)
+    if checkpoint is None:
+        checksum = hashlib.sha256()
+        checkpoint = {
+            "format": checkpoint_format,
+            "source": os.path.abspath(network_incidents),
+            "offset": 0,
+            "line_number": 0,
+            "fieldnames": None,
+            "fingerprint": None,
+            "aggregates": new_aggregates(recurrence_weeks=recurrence_weeks),
+            "data_quality_issues": DataQualityIssues(network_incidents),
+        }
+
+    aggregates = checkpoint["aggregates"]
+    position = {"offset": checkpoint["offset"], "line_number": checkpoint["line_number"], "fieldnames": checkpoint["fieldnames"]}
+    start_offset = position["offset"]
+    with instrumentation.active.stage("aggregate"):
+        for ticket in instrumentation.active.timed(read_incident_records(network_incidents, checkpoint["data_quality_issues"], position), "parse_and_validate"):
+            fold_ticket(aggregates, ticket)
+
+    checkpoint["offset"] = position["offset"]
+    checkpoint["line_number"] = position["line_number"]
+    checkpoint["fieldnames"] = position["fieldnames"]
+    # The checksum of the bytes verified on loading goes on with the new ones only
+    checkpoint["fingerprint"] = update_checksum(checksum, network_incidents, start_offset, position["offset"]).hexdigest()
+    with instrumentation.active.stage("save_checkpoint"):
+        save_checkpoint(checkpoint_file, checkpoint)
+    instrumentation.active.count("bytes_read", position["offset"] - start_offset)
+
+    # A last row without a newline is included in this report but not in the checkpoint,
+    # it is read again on the next run when it may have been completed
+    data_quality_issues = checkpoint["data_quality_issues"].copy()
+    position["unterminated"] = True
+    for ticket in read_incident_records(network_incidents, data_quality_issues, position):
+        fold_ticket(aggregates, ticket)
+    count_incidents(aggregates, data_quality_issues)
+
+    if not aggregates["ticket_count"]:
+        data_quality_issues.add_message("Inga giltiga rader kunde läsas in från CSV-filen.")
+        return {"data_quality_issues": data_quality_issues}
+
+    # Building the sections changes the state in place, so it only runs after the checkpoint is saved
+    with instrumentation.active.stage("build_report_data"):
+        data = build_report_data(aggregates)
+    data["data_quality_issues"] = data_quality_issues
+    return data
+
+# Loads a checkpoint if it still matches the input file and window length. Returns it with
+# the checksum of the processed bytes, to be continued with the ones read next, or
+# (None, None)
+def load_checkpoint(checkpoint_file, network_incidents, recurrence_weeks=recurrence_window_weeks):
+    if not os.path.exists(checkpoint_file):
+        return None, None
+
+    with open(checkpoint_file, mode="rb") as file:
+        checkpoint = pickle.load(file)
+
+    if checkpoint.get("format") != checkpoint_format or checkpoint["source"] != os.path.abspath(network_incidents):
+        return None, None
+    if checkpoint["aggregates"]["recurrence"].window_weeks != recurrence_weeks:
+        return None, None
+    # A file that shrank or whose already processed bytes changed has been rewritten
+    if not os.path.exists(network_incidents) or os.path.getsize(network_incidents) < checkpoint["offset"]:
+        return None, None
+    checksum = input_checksum(network_incidents, checkpoint["offset"])
+    if checksum.hexdigest() != checkpoint["fingerprint"]:
+        return None, None
+
+    return checkpoint, checksum
+
+# Writes the checkpoint to a temporary file first so a crash never leaves a broken checkpoint
+def save_checkpoint(checkpoint_file, checkpoint):
+    temporary_file = f"{checkpoint_file}.tmp"
+    with open(temporary_file, mode="wb") as file:
+        pickle.dump(checkpoint, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary_file, checkpoint_file)
+
+# Checksum of every byte before offset, the part of the file already processed. Any
+# rewrite of it, even one that keeps the size, falls back to a full rebuild. Reading the
+# bytes again costs far less than parsing them again
+def input_checksum(network_incidents, offset):
+    return update_checksum(hashlib.sha256(), network_incidents, 0, offset)
+
+# Adds the bytes from start to end to a running checksum, so a file that grew is only
+# checksummed from where the last check stopped
+def update_checksum(checksum, network_incidents, start, end):
+    with open(network_incidents, mode="rb") as file:
+        file.seek(start)
+        while start < end:
+            block = file.read(min(end - start, fingerprint_block_size))
+            if not block:
+                break
+            checksum.update(block)
+            start += len(block)
+    return checksum
+
+# Quick check that the bytes before offset are still the ones read: the device and inode of
+# the file and a checksum of the last tail_block_size bytes. Only a file replaced by another
+# one or changed close to the offset fails it, anything else needs input_checksum
+def input_tail(network_incidents, offset):
+    status = os.stat(network_incidents)
+    checksum = update_checksum(hashlib.sha256(), network_incidents, max(0, offset - tail_block_size), offset)
+    return status.st_dev, status.st_ino, checksum.hexdigest()
+
+# Lists the csv files to read. Directories and glob patterns are sorted so the merge
+# order is always the same, and leave out the csv files this program writes itself so a
+# run in the directory it writes to does not read its own output
+def find_incident_files(network_incidents):
+    if not isinstance(network_incidents, str):
+        return [incident_file for source in network_incidents for incident_file in find_incident_files(source)]
+    if os.path.isdir(network_incidents):
+        incident_files = glob.glob(os.path.join(network_incidents, "*.csv"))
+    elif glob.has_magic(network_incidents):
+        incident_files = glob.glob(network_incidents)
+    else:
+        return [network_incidents]
+    return sorted(incident_file for incident_file in incident_files if os.path.basename(incident_file) not in output_filenames)
+
+# Parses a single csv file into a partial aggregate, used directly or by the process pool.
+# A cached file has no rows to write to a reject file, so the cache is only read without one
+def aggregate_incident_file(incident_file, backend="python", keep_tickets=False, groups=aggregate_groups, cache_dir=None, reject_file=None, recurrence_weeks=recurrence_window_weeks):
+    data_quality_issues = DataQualityIssues(incident_file, reject_file)
+    try:
+        aggregates = aggregate_incident_rows(incident_file, data_quality_issues, backend, keep_tickets, groups, cache_dir, reject_file is None, recurrence_weeks)
+    finally:
+        data_quality_issues.close()
+    return aggregates, data_quality_issues
+
+def aggregate_incident_rows(incident_file, data_quality_issues, backend, keep_tickets, groups, cache_dir, read_cache, recurrence_weeks):
+    if backend == "numpy":
+        if np is None:
+            raise ImportError("NumPy-backenden kräver numpy (pip install numpy)")
+        with instrumentation.active.stage("load_column_cache"):
+            cached = column_cache.load_columns(incident_file, cache_dir) if cache_dir is not None and read_cache else None
+        if cached is not None:
+            instrumentation.active.count("column_cache_hits")
+            columns, cached_issues = cached
+            data_quality_issues.merge(DataQualityIssues.from_dict(cached_issues, incident_file))
+            with instrumentation.active.stage("index_from_columns"):
+                index = index_from_columns(columns, keep_tickets) if "index" in groups else None
+        else:
+            index = IncidentIndex(keep_tickets) if "index" in groups else None
+            source_key = column_cache.source_key(incident_file) if cache_dir is not None else None
+            with instrumentation.active.stage("parse_and_validate"):
+                columns = load_incident_columns(incident_file, data_quality_issues, index)
+            if cache_dir is not None:
+                instrumentation.active.count("column_cache_misses")
+                with instrumentation.active.stage("save_column_cache"):
+                    column_cache.save_columns(incident_file, cache_dir, columns, data_quality_issues.as_dict(), source_key)
+        with instrumentation.active.stage("aggregate_columns"):
+            aggregates = aggregate_incident_columns(columns, index, groups, recurrence_weeks) if len(columns["cost_ore"]) else new_aggregates(keep_tickets, groups, recurrence_weeks)
+    else:
+        aggregates = new_aggregates(keep_tickets, groups, recurrence_weeks)
+        # Folds every parsed ticket into the aggregates as soon as it is read. The time spent
+        # reading and validating rows is recorded separately from the time spent folding them
+        for ticket in instrumentation.active.timed(read_incident_records(incident_file, data_quality_issues), "parse_and_validate"):
+            fold_ticket(aggregates, ticket)
+
+    return aggregates
+
+# Reads and validates the csv file, yielding one IncidentRecord per valid row. Rejected
+# rows are recorded in data_quality_issues (a DataQualityIssues) with the rule they broke.
+# With a position ({"offset", "line_number", "fieldnames"}) reading starts at that byte offset
+# and the position is moved past every complete row, so a half-written last row is left for later
+def read_incident_records(network_incidents, data_quality_issues, position=None):
+    file = open(network_incidents, mode="rb")
+    if position is None:
+        # A whole file has no position to keep, it is decoded a block at a time
+        position = {"offset": 0, "line_number": 0, "fieldnames": None, "invalid_encoding": False}
+        csv_reader = csv.reader(chain.from_iterable(read_blocks(file, position)))
+        rows = read_file_rows(csv_reader, data_quality_issues, position)
+    else:
+        file.seek(position["offset"])
+        position["read"] = position["offset"]
+        position["exhausted"] = False
+        position["invalid_encoding"] = False
+        csv_reader = csv.reader(read_lines(file, position))
+        rows = read_rows(csv_reader, data_quality_issues, position)
+    fieldnames = position["fieldnames"]
+    first_line = position["line_number"]
+
+    with file:
+        if fieldnames is None:
+            fieldnames = next(rows, None)
+
+        if fieldnames is not None:
+            data_quality_issues.fieldnames = fieldnames
+            validate_row = compile_validator(fieldnames)
+
+            line_number = csv_reader.line_num
+            for row in rows:
+                # Rows can span several lines, the issue points at the line the row starts on
+                row_line = first_line + line_number + 1
+                line_number = csv_reader.line_num
+                if not row:
+                    continue
+
+                try:
+                    ticket = validate_row(row)
+                except InvalidRow as invalid:
+                    data_quality_issues.record(invalid.rule, row_line, invalid.field, invalid.value, row)
+                    continue
+                except Exception as exc:
+                    data_quality_issues.record("unknown_error", row_line, None, str(exc), row)
+                    continue
+
+                yield ticket
+
+    position["fieldnames"] = fieldnames
+
+# Raised by a compiled validator for a row that breaks one of the validation rules
+class InvalidRow(ValueError):
+
+    def __init__(self, rule, field, value):
+        super().__init__(f"{rule}: {field}={value!r}")
+        self.rule = rule
+        self.field = field
+        self.value = value
+
+# Compiles validation_rules for a csv header into a function that checks one row (a list
+# of values) and returns its IncidentRecord, or raises InvalidRow for the first rule it
+# breaks. Column positions and missing columns are worked out once here, not for every row
+def compile_validator(fieldnames):
+    columns = {field: index for index, field in enumerate(fieldnames)}
+
+    missing_fields = [field for field in required_fields if field not in columns]
+    if missing_fields:
+        def reject_row(row):
+            raise InvalidRow("required_fields", missing_fields[0], "")
+        return reject_row
+
+    used_columns = [columns[field] for field in required_fields + list(optional_defaults) if field in columns]
+    row_length = max(used_columns) + 1
+    rules = [(rule, field, columns.get(field), optional_defaults.get(field), parse) for rule, field, parse in validation_rules]
+
+    ticket_id_column = columns["ticket_id"]
+    site_column = columns["site"]
+    severity_column = columns["severity"]
+    category_column = columns["category"]
+    cost_sek_column = columns["cost_sek"]
+    device_hostname_column = columns.get("device_hostname")
+
+    def validate_row(row):
+        if len(row) < row_length:
+            raise InvalidRow("column_count", fieldnames[len(row)], "")
+
+        parsed = {}
+        for rule, field, column, default, parse in rules:
+            value = row[column] if column is not None else default
+            try:
+                parsed[field] = parse(value)
+            except ValueError:
+                raise InvalidRow(rule, field, value) from None
+
+        return IncidentRecord.from_fields(
+            row[ticket_id_column],
+            parsed["week_number"],
+            row[site_column],
+            row[device_hostname_column] if device_hostname_column is not None else optional_defaults["device_hostname"],
+            row[severity_column],
+            row[category_column],
+            parsed["resolution_minutes"],
+            parsed["affected_users"],
+            row[cost_sek_column],
+            parsed["cost_sek"],
+            parsed["impact_score"],
+        )
+
+    return validate_row
+
+# Yields the lines of a binary file that end with a newline and counts their bytes in
+# position["read"]. A last line without a newline is only yielded when position["unterminated"]
+# is set. A line that is not valid UTF-8 is decoded with replacement characters and flagged
+# in position["invalid_encoding"], so the row it belongs to can be rejected
+def read_lines(file, position):
+    for line in file:
+        if not line.endswith(b"\n") and not position.get("unterminated"):
+            break
+        position["read"] += len(line)
+        try:
+            yield line.decode("utf-8")
+        except UnicodeDecodeError:
+            position["invalid_encoding"] = True
+            yield line.decode("utf-8", errors="replace")
+    position["exhausted"] = True
+
+# Yields the lines of a whole binary file in blocks ending with a newline, for
+# chain.from_iterable. A block that is valid UTF-8, nearly always all of them, is decoded
+# in one call and split into lines by a StringIO like a text file would. Only a block with
+# broken bytes is decoded line by line, flagging them like read_lines. Bytes are not counted
+def read_blocks(file, position):
+    remainder = b""
+    while True:
+        block = file.read(read_block_size)
+        data = remainder + block
+        if block:
+            end = data.rfind(b"\n") + 1
+            data, remainder = data[:end], data[end:]
+        if data:
+            try:
+                yield io.StringIO(data.decode("utf-8"), newline="")
+            except UnicodeDecodeError:
+                yield decode_lines(data, position)
+        if not block:
+            break
+
+def decode_lines(data, position):
+    for line in data.splitlines(keepends=True):
+        try:
+            yield line.decode("utf-8")
+        except UnicodeDecodeError:
+            position["invalid_encoding"] = True
+            yield line.decode("utf-8", errors="replace")
+
+# Yields the rows of csv_reader and moves position["offset"] and ["line_number"] past every
+# row that is complete. The csv reader only asks for another line while a row is
+# unfinished, so a row that took the last line inside an open quote was cut off by a write
+# in progress. Without position["unterminated"] that row and everything after it is left
+# for the next read. Rows with broken encoding or csv syntax are recorded in
+# data_quality_issues and passed on empty, so line numbers stay right
+def read_rows(csv_reader, data_quality_issues, position):
+    first_line = position["line_number"]
+    unterminated = position.get("unterminated")
+    line_number = 0
+    while True:
+        try:
+            for row in csv_reader:
+                if position["exhausted"] and not unterminated:
+                    return
+                row_line = first_line + line_number + 1
+                line_number = csv_reader.line_num
+                position["offset"] = position["read"]
+                position["line_number"] = first_line + line_number
+                if position["invalid_encoding"]:
+                    position["invalid_encoding"] = False
+                    data_quality_issues.record("utf8_encoding", row_line, None, ",".join(row), row)
+                    row = []
+                yield row
+            return
+        except csv.Error as error:
+            if position["exhausted"] and not unterminated:
+                return
+            row_line = first_line + line_number + 1
+            line_number = csv_reader.line_num
+            position["offset"] = position["read"]
+            position["line_number"] = first_line + line_number
+            position["invalid_encoding"] = False
+            data_quality_issues.record("csv_syntax", row_line, None, str(error), [])
+            yield []
+
+# read_rows for a whole file, where no position has to be kept and only the line numbers
+# of rows with broken encoding or csv syntax are followed
+def read_file_rows(csv_reader, data_quality_issues, position):
+    line_number = 0
+    while True:
+        try:
+            for row in csv_reader:
+                if position["invalid_encoding"]:
+                    position["invalid_encoding"] = False
+                    data_quality_issues.record("utf8_encoding", line_number + 1, None, ",".join(row), row)
+                    row = []
+                line_number = csv_reader.line_num
+                yield row
+            return
+        except csv.Error as error:
+            position["invalid_encoding"] = False
+            data_quality_issues.record("csv_syntax", line_number + 1, None, str(error), [])
+            line_number = csv_reader.line_num
+            yield []
+
+# Compact representation of a validated ticket where every field is parsed exactly once
+class IncidentRecord:
+    __slots__ = (
+        "ticket_id",
+        "week_number",
+        "site",
+        "device_hostname",
+        "device_type",
+        "severity",
+        "category",
+        "resolution_minutes",
+        "affected_users",
+        "cost_sek",
+        "cost_ore",
+        "impact_score",
+    )
+
+    def __init__(self, ticket_id, week_number, site, device_hostname, device_type, severity, category, resolution_minutes, affected_users, cost_sek, cost_ore, impact_score):
+        self.ticket_id = ticket_id
+        self.week_number = week_number
+        self.site = site
+        self.device_hostname = device_hostname
+        self.device_type = device_type
+        self.severity = severity
+        self.category = category
+        self.resolution_minutes = resolution_minutes
+        self.affected_users = affected_users
+        self.cost_sek = cost_sek
+        self.cost_ore = cost_ore
+        self.impact_score = impact_score
+
+    # Builds a record from the values of a validated row. Repeated strings are interned
+    # so every site, category and hostname is stored once
+    @classmethod
+    def from_fields(cls, ticket_id, week_number, site, device_hostname, severity, category, resolution_minutes, affected_users, cost_sek, cost_ore, impact_score):
+        if device_hostname == "N/A":
+            device_hostname = None
+            device_type = None
+        else:
+            device_hostname = sys.intern(device_hostname)
+            device_type = device_type_from_hostname(device_hostname)
+
+        return cls(
+            ticket_id,
+            week_number,
+            sys.intern(site),
+            device_hostname,
+            device_type,
+            sys.intern(severity.lower()),
+            sys.intern(category),
+            resolution_minutes,
+            affected_users,
+            cost_sek,
+            cost_ore,
+            impact_score,
+        )
+
+# Secondary indexes filled while the tickets are read. The counts per (site, severity)
+# and per (device, week) are always kept and make the summaries constant-time lookups.
+# With keep_tickets the tickets themselves are also indexed for drill-down queries
+class IncidentIndex:
+
+    def __init__(self, keep_tickets=False):
+        self.keep_tickets = keep_tickets
+        self.site_severity_counts = {}
+        self.device_week_counts = {}
+        self.by_site = defaultdict(list)
+        self.by_week = defaultdict(list)
+        self.by_site_severity = defaultdict(list)
+        self.by_device_week = defaultdict(list)
+
+    def add(self, ticket):
+        severity_counts = self.site_severity_counts.setdefault(ticket.site, {})
+        severity_counts[ticket.severity] = severity_counts.get(ticket.severity, 0) + 1
+
+        if ticket.device_hostname is not None:
+            week_counts = self.device_week_counts.setdefault(ticket.device_hostname, {})
+            week_counts[ticket.week_number] = week_counts.get(ticket.week_number, 0) + 1
+
+        if self.keep_tickets:
+            self.by_site[ticket.site].append(ticket)
+            self.by_week[ticket.week_number].append(ticket)
+            self.by_site_severity[(ticket.site, ticket.severity)].append(ticket)
+            if ticket.device_hostname is not None:
+                self.by_device_week[(ticket.device_hostname, ticket.week_number)].append(ticket)
+
+    # Adds an index built from input that follows everything already added
+    def merge(self, other):
+        for site, severity_counts in other.site_severity_counts.items():
+            own_counts = self.site_severity_counts.setdefault(site, {})
+            for severity, count in severity_counts.items():
+                own_counts[severity] = own_counts.get(severity, 0) + count
+
+        for device_hostname, week_counts in other.device_week_counts.items():
+            own_counts = self.device_week_counts.setdefault(device_hostname, {})
+            for week_number, count in week_counts.items():
+                own_counts[week_number] = own_counts.get(week_number, 0) + count
+
+        if self.keep_tickets:
+            for own_index, other_index in [(self.by_site, other.by_site), (self.by_week, other.by_week), (self.by_site_severity, other.by_site_severity), (self.by_device_week, other.by_device_week)]:
+                for key, tickets in other_index.items():
+                    own_index[key].extend(tickets)
+
+    def incident_count(self, site=None, severity=None, device_hostname=None, week_number=None):
+        if device_hostname is not None:
+            week_counts = self.device_week_counts.get(device_hostname, {})
+            return week_counts.get(week_number, 0) if week_number is not None else sum(week_counts.values())
+
+        severity_counts = self.site_severity_counts.get(site, {})
+        return severity_counts.get(severity, 0) if severity is not None else sum(severity_counts.values())
+
+    def sites_without_severity(self, severity, sites=None):
+        sites = self.site_severity_counts if sites is None else sites
+        return [site for site in sites if not self.incident_count(site=site, severity=severity)]
+
+    def weeks_for_device(self, device_hostname):
+        return sorted(self.device_week_counts.get(device_hostname, {}))
+
+    def tickets_for_site(self, site, severity=None):
+        self.require_tickets()
+        if severity is not None:
+            return self.by_site_severity.get((site, severity), [])
+        return self.by_site.get(site, [])
+
+    def tickets_for_device(self, device_hostname, week_number=None):
+        self.require_tickets()
+        if week_number is not None:
+            return self.by_device_week.get((device_hostname, week_number), [])
+        return [ticket for week in self.weeks_for_device(device_hostname) for ticket in self.by_device_week[(device_hostname, week)]]
+
+    def tickets_for_week(self, week_number):
+        self.require_tickets()
+        return self.by_week.get(week_number, [])
+
+    def require_tickets(self):
+        if not self.keep_tickets:
+            raise ValueError("Indexet byggdes utan ärenden, läs in med keep_tickets=True")
+
+# Streaming quantile estimate with a fixed relative error (a DDSketch). Values are counted
+# in logarithmic buckets, so memory depends on the range of the values and not on how
+# many there are. Two sketches merge by adding their bucket counts, which gives the same
+# result whatever order the input was read and merged in
+class QuantileSketch:
+
+    def __init__(self, relative_accuracy=quantile_relative_accuracy, max_buckets=quantile_max_buckets):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.max_buckets = max_buckets
+        self.positive = {}
+        self.negative = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value, count=1):
+        if value > 0:
+            self.add_to_bucket(self.positive, math.ceil(math.log(value) / self.log_gamma), count)
+        elif value < 0:
+            self.add_to_bucket(self.negative, math.ceil(math.log(-value) / self.log_gamma), count)
+        else:
+            self.zero_count += count
+        self.count += count
+
+    # The smallest magnitudes are folded together when there are too many buckets, so
+    # the upper percentiles keep their accuracy
+    def add_to_bucket(self, buckets, key, count):
+        buckets[key] = buckets.get(key, 0) + count
+        if len(buckets) > self.max_buckets:
+            lowest, next_lowest = sorted(buckets)[:2]
+            buckets[next_lowest] += buckets.pop(lowest)
+
+    def merge(self, other):
+        for key, count in other.positive.items():
+            self.add_to_bucket(self.positive, key, count)
+        for key, count in other.negative.items():
+            self.add_to_bucket(self.negative, key, count)
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+    # Estimated value at quantile q (0.5 for the median), 0 for an empty sketch
+    def quantile(self, q):
+        if not self.count:
+            return 0
+        rank = q * (self.count - 1)
+
+        seen = 0
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return -self.bucket_value(key)
+        seen += self.zero_count
+        if seen > rank:
+            return 0
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return self.bucket_value(key)
+        return self.bucket_value(max(self.positive))
+
+    def bucket_value(self, key):
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+# Weekly incident counts, severity scores and costs per device over the last
+# window_weeks weeks. Every device has a ring buffer with one slot per week of the window:
+# week w lands in slot w % window_weeks and replaces the week in that slot if it is newer.
+# A ticket for a week older than the one in its slot can't be inside any window that
+# includes the newer week, so it is dropped. This makes every ticket constant work and
+# gives the same buffers whatever order the weeks are read and merged in
+class RecurrenceWindow:
+
+    # The trend compares the last two weeks, so a window needs at least two
+    def __init__(self, window_weeks=recurrence_window_weeks):
+        if window_weeks < 2:
+            raise ValueError(f"Fönstret för återkommande enheter måste vara minst 2 veckor, inte {window_weeks}")
+        self.window_weeks = window_weeks
+        self.devices = {}
+
+    def add(self, device_hostname, week_number, incident_count=1, severity_score=0, cost_ore=0):
+        buffer = self.devices.get(device_hostname)
+        if buffer is None:
+            buffer = self.devices[device_hostname] = {
+                "weeks": [None] * self.window_weeks,
+                "incident_counts": [0] * self.window_weeks,
+                "severity_scores": [0] * self.window_weeks,
+                "costs_ore": [0] * self.window_weeks,
+            }
+
+        slot = week_number % self.window_weeks
+        slot_week = buffer["weeks"][slot]
+        if slot_week != week_number:
+            if slot_week is not None and slot_week > week_number:
+                return
+            buffer["weeks"][slot] = week_number
+            buffer["incident_counts"][slot] = 0
+            buffer["severity_scores"][slot] = 0
+            buffer["costs_ore"][slot] = 0
+
+        buffer["incident_counts"][slot] += incident_count
+        buffer["severity_scores"][slot] += severity_score
+        buffer["costs_ore"][slot] += cost_ore
+
+    # Adds a window built from any other part of the input
+    def merge(self, other):
+        if other.window_weeks != self.window_weeks:
+            raise ValueError(f"Kan inte slå ihop fönster på {other.window_weeks} och {self.window_weeks} veckor")
+        for device_hostname, buffer in other.devices.items():
+            for slot, week_number in enumerate(buffer["weeks"]):
+                if week_number is not None:
+                    self.add(device_hostname, week_number, buffer["incident_counts"][slot], buffer["severity_scores"][slot], buffer["costs_ore"][slot])
+
+    # Incident counts, severity scores and costs of a device for the window_weeks weeks
+    # ending with current_week, oldest week first
+    def weekly(self, device_hostname, current_week):
+        incident_counts = [0] * self.window_weeks
+        severity_scores = [0] * self.window_weeks
+        costs_ore = [0] * self.window_weeks
+        buffer = self.devices.get(device_hostname)
+        if buffer is not None:
+            for slot, week_number in enumerate(buffer["weeks"]):
+                if week_number is not None and current_week - self.window_weeks < week_number <= current_week:
+                    position = self.window_weeks - 1 - (current_week - week_number)
+                    incident_counts[position] = buffer["incident_counts"][slot]
+                    severity_scores[position] = buffer["severity_scores"][slot]
+                    costs_ore[position] = buffer["costs_ore"][slot]
+        return incident_counts, severity_scores, costs_ore
+
+# Incidents per week over a run of weekly counts
+def incident_rate(incident_counts):
+    return sum(incident_counts) / len(incident_counts) if incident_counts else 0
+
+# Least-squares slope of the weekly counts, in incidents per week per week
+def incident_trend(incident_counts):
+    weeks = len(incident_counts)
+    if weeks < 2:
+        return 0
+    middle = (weeks - 1) / 2
+    spread = sum((week - middle) ** 2 for week in range(weeks))
+    return sum((week - middle) * count for week, count in enumerate(incident_counts)) / spread
+
+# Flags a run of weekly counts, oldest week first, as a recurring problem by its rate and trend
+def is_recurring(incident_counts):
+    if sum(1 for count in incident_counts if count) < recurrence_min_weeks:
+        return False
+    return incident_rate(incident_counts) >= recurrence_rate or incident_trend(incident_counts) > 0
+
+# Creates the running state that every ticket is folded into. Only the requested
+# aggregate groups are set up, so work for groups nobody asked for is skipped
+def new_aggregates(keep_tickets=False, groups=aggregate_groups, recurrence_weeks=recurrence_window_weeks):
+    aggregates = {"ticket_count": 0, "groups": tuple(groups)}
+
+    if "totals" in groups:
+        aggregates["total_cost_ore"] = 0
+        aggregates["severity_counts"] = defaultdict(int)
+        aggregates["severity_resolution_minutes"] = defaultdict(int)
+        aggregates["severity_resolution_sketches"] = defaultdict(QuantileSketch)
+    if "weeks" in groups:
+        aggregates["unique_weeks"] = set()
+        aggregates["current_week"] = 0
+    if "top_expensive" in groups:
+        aggregates["top_expensive_heap"] = []
+    if "high_impact" in groups:
+        aggregates["high_impact_incidents"] = []
+    if "sites" in groups:
+        aggregates["sites"] = {}
+    if "index" in groups:
+        aggregates["index"] = IncidentIndex(keep_tickets)
+    if "device_counts" in groups:
+        aggregates["incidents_per_device"] = defaultdict(int)
+    if "devices" in groups:
+        aggregates["device_info"] = {}
+    if "recurrence" in groups:
+        aggregates["recurrence"] = RecurrenceWindow(recurrence_weeks)
+    if "categories" in groups:
+        aggregates["categories"] = defaultdict(new_category_stats)
+    if "weekly" in groups:
+        aggregates["weekly_cost_analysis"] = {}
+
+    return aggregates
+
+# Named instead of a lambda so partial aggregates can be sent between processes
+def new_category_stats():
+    return {"incident_count": 0, "total_impact": 0.0}
+
+# Updates all requested aggregate groups with a single validated ticket
+def fold_ticket(aggregates, ticket):
+    sequence = aggregates["ticket_count"]
+    aggregates["ticket_count"] += 1
+
+    for group in aggregates["groups"]:
+        group_folders[group](aggregates, ticket, sequence)
+
+# Counts amount of tickets and sorts by severity level, adds resolution time per severity and total cost
+def fold_totals(aggregates, ticket, sequence):
+    aggregates["severity_counts"][ticket.severity] += 1
+    aggregates["severity_resolution_minutes"][ticket.severity] += ticket.resolution_minutes
+    aggregates["severity_resolution_sketches"][ticket.severity].add(ticket.resolution_minutes)
+    aggregates["total_cost_ore"] += ticket.cost_ore
+
+def fold_weeks(aggregates, ticket, sequence):
+    aggregates["unique_weeks"].add(ticket.week_number)
+    aggregates["current_week"] = max(aggregates["current_week"], ticket.week_number)
+
+# Keeps only the 5 most expensive incidents, ties are won by the earliest ticket
+def fold_top_expensive(aggregates, ticket, sequence):
+    push_top_expensive(aggregates["top_expensive_heap"], (ticket.cost_ore, -sequence, ticket))
+
+# Adds incidents that affect more than 100 users
+def fold_high_impact(aggregates, ticket, sequence):
+    if ticket.affected_users is not None and ticket.affected_users > 100:
+        aggregates["high_impact_incidents"].append(ticket)
+
+# Collect incident information by site
+def fold_sites(aggregates, ticket, sequence):
+    site = ticket.site
+    if site not in aggregates["sites"]:
+        aggregates["sites"][site] = {"incident_count": 0, "total_cost_ore": 0, "resolution_minutes": 0, "resolution_sketch": QuantileSketch(), "weeks": set()}
+
+    aggregates["sites"][site]["incident_count"] += 1
+    aggregates["sites"][site]["total_cost_ore"] += ticket.cost_ore
+    aggregates["sites"][site]["resolution_minutes"] += ticket.resolution_minutes
+    aggregates["sites"][site]["resolution_sketch"].add(ticket.resolution_minutes)
+    aggregates["sites"][site]["weeks"].add(ticket.week_number)
+
+def fold_index(aggregates, ticket, sequence):
+    aggregates["index"].add(ticket)
+
+# Counts incidents per device to be used in Executive Summary
+def fold_device_counts(aggregates, ticket, sequence):
+    if ticket.device_hostname is not None:
+        aggregates["incidents_per_device"][ticket.device_hostname] += 1
+
+# Collects device info to be used in problem_devices.csv
+def fold_devices(aggregates, ticket, sequence):
+    device_hostname = ticket.device_hostname
+    if device_hostname is None:
+        return
+
+    if device_hostname not in aggregates["device_info"]:
+        aggregates["device_info"][device_hostname] = {
+            "site": ticket.site,
+            "device_type": ticket.device_type,
+            "incident_count": 0,
+            "severity_score": 0,
+            "total_cost_ore": 0,
+            "affected_users": 0,
+            "affected_users_count": 0
+        }
+
+    device_data = aggregates["device_info"][device_hostname]
+    device_data["incident_count"] += 1
+    device_data["severity_score"] += severity_scores.get(ticket.severity, 0)
+    device_data["total_cost_ore"] += ticket.cost_ore
+
+    if ticket.affected_users is not None and ticket.affected_users >= 0:
+        device_data["affected_users"] += ticket.affected_users
+        device_data["affected_users_count"] += 1
+
+def fold_recurrence(aggregates, ticket, sequence):
+    if ticket.device_hostname is not None:
+        aggregates["recurrence"].add(ticket.device_hostname, ticket.week_number, 1, severity_scores.get(ticket.severity, 0), ticket.cost_ore)
+
+# Collect information by category
+def fold_categories(aggregates, ticket, sequence):
+    category_data = aggregates["categories"][ticket.category]
+    category_data["incident_count"] += 1
+    category_data["total_impact"] += ticket.impact_score
+
+# Collects cost information and impact scores to be added to "cost_analysis.csv" file
+def fold_weekly(aggregates, ticket, sequence):
+    week_number = ticket.week_number
+    if week_number not in aggregates["weekly_cost_analysis"]:
+        aggregates["weekly_cost_analysis"][week_number] = {
+            "incident_count": 0,
+            "total_cost_ore": 0,
+            "total_impact": 0.0
+        }
+
+    aggregates["weekly_cost_analysis"][week_number]["incident_count"] += 1
+    aggregates["weekly_cost_analysis"][week_number]["total_cost_ore"] += ticket.cost_ore
+    aggregates["weekly_cost_analysis"][week_number]["total_impact"] += ticket.impact_score
+
+group_folders = {
+    "totals": fold_totals,
+    "weeks": fold_weeks,
+    "top_expensive": fold_top_expensive,
+    "high_impact": fold_high_impact,
+    "sites": fold_sites,
+    "index": fold_index,
+    "device_counts": fold_device_counts,
+    "devices": fold_devices,
+    "recurrence": fold_recurrence,
+    "categories": fold_categories,
+    "weekly": fold_weekly,
+}
+
+# Adds an incident to the bounded min-heap of the most expensive incidents
+def push_top_expensive(heap, heap_entry):
+    if len(heap) < top_expensive_limit:
+        heapq.heappush(heap, heap_entry)
+    else:
+        heapq.heappushpop(heap, heap_entry)
+
+# Merges a partial aggregate with the same groups into aggregates. The partial must come
+# from the input that follows everything already merged, its dicts are taken over rather than copied
+def merge_aggregates(aggregates, partial):
+    offset = aggregates["ticket_count"]
+    aggregates["ticket_count"] += partial["ticket_count"]
+
+    for group in partial["groups"]:
+        group_mergers[group](aggregates, partial, offset)
+
+def merge_totals(aggregates, partial, offset):
+    aggregates["total_cost_ore"] += partial["total_cost_ore"]
+    for severity, count in partial["severity_counts"].items():
+        aggregates["severity_counts"][severity] += count
+    for severity, resolution_minutes in partial["severity_resolution_minutes"].items():
+        aggregates["severity_resolution_minutes"][severity] += resolution_minutes
+    for severity, sketch in partial["severity_resolution_sketches"].items():
+        aggregates["severity_resolution_sketches"][severity].merge(sketch)
+
+def merge_weeks(aggregates, partial, offset):
+    aggregates["unique_weeks"].update(partial["unique_weeks"])
+    aggregates["current_week"] = max(aggregates["current_week"], partial["current_week"])
+
+# Shifts the ticket order of the partial so ties still go to the earliest ticket
+def merge_top_expensive(aggregates, partial, offset):
+    for cost_ore, negative_sequence, ticket in partial["top_expensive_heap"]:
+        push_top_expensive(aggregates["top_expensive_heap"], (cost_ore, negative_sequence - offset, ticket))
+
+def merge_high_impact(aggregates, partial, offset):
+    aggregates["high_impact_incidents"].extend(partial["high_impact_incidents"])
+
+def merge_sites(aggregates, partial, offset):
+    for site, site_data in partial["sites"].items():
+        if site not in aggregates["sites"]:
+            aggregates["sites"][site] = site_data
+            continue
+        aggregates["sites"][site]["incident_count"] += site_data["incident_count"]
+        aggregates["sites"][site]["total_cost_ore"] += site_data["total_cost_ore"]
+        aggregates["sites"][site]["resolution_minutes"] += site_data["resolution_minutes"]
+        aggregates["sites"][site]["resolution_sketch"].merge(site_data["resolution_sketch"])
+        aggregates["sites"][site]["weeks"].update(site_data["weeks"])
+
+def merge_index(aggregates, partial, offset):
+    aggregates["index"].merge(partial["index"])
+
+def merge_device_counts(aggregates, partial, offset):
+    for device_hostname, count in partial["incidents_per_device"].items():
+        aggregates["incidents_per_device"][device_hostname] += count
+
+def merge_devices(aggregates, partial, offset):
+    for device_hostname, device_data in partial["device_info"].items():
+        if device_hostname not in aggregates["device_info"]:
+            aggregates["device_info"][device_hostname] = device_data
+            continue
+        aggregates["device_info"][device_hostname]["incident_count"] += device_data["incident_count"]
+        aggregates["device_info"][device_hostname]["severity_score"] += device_data["severity_score"]
+        aggregates["device_info"][device_hostname]["total_cost_ore"] += device_data["total_cost_ore"]
+        aggregates["device_info"][device_hostname]["affected_users"] += device_data["affected_users"]
+        aggregates["device_info"][device_hostname]["affected_users_count"] += device_data["affected_users_count"]
+
+def merge_recurrence(aggregates, partial, offset):
+    aggregates["recurrence"].merge(partial["recurrence"])
+
+def merge_categories(aggregates, partial, offset):
+    for category, category_data in partial["categories"].items():
+        aggregates["categories"][category]["incident_count"] += category_data["incident_count"]
+        aggregates["categories"][category]["total_impact"] += category_data["total_impact"]
+
+def merge_weekly(aggregates, partial, offset):
+    for week_number, week_data in partial["weekly_cost_analysis"].items():
+        if week_number not in aggregates["weekly_cost_analysis"]:
+            aggregates["weekly_cost_analysis"][week_number] = week_data
+            continue
+        aggregates["weekly_cost_analysis"][week_number]["incident_count"] += week_data["incident_count"]
+        aggregates["weekly_cost_analysis"][week_number]["total_cost_ore"] += week_data["total_cost_ore"]
+        aggregates["weekly_cost_analysis"][week_number]["total_impact"] += week_data["total_impact"]
+
+group_mergers = {
+    "totals": merge_totals,
+    "weeks": merge_weeks,
+    "top_expensive": merge_top_expensive,
+    "high_impact": merge_high_impact,
+    "sites": merge_sites,
+    "index": merge_index,
+    "device_counts": merge_device_counts,
+    "devices": merge_devices,
+    "recurrence": merge_recurrence,
+    "categories": merge_categories,
+    "weekly": merge_weekly,
+}
+
+# Builds the centralized datastructure used by the report and CSV writers from the
+# requested sections
+def build_report_data(aggregates, sections=None):
+    data = {}
+    for section in report_sections if sections is None else sections:
+        data.update(report_sections[section][0](aggregates))
+    return data
+
+# Lists the aggregate groups needed by a set of report sections
+def section_groups(sections):
+    return [group for group in aggregate_groups if any(group in report_sections[section][1] for section in sections)]
+
+# Sorts the 5 most expensive incidents, most expensive first
+def sorted_top_expensive(aggregates):
+    return [(ticket, cost_ore) for cost_ore, _, ticket in sorted(aggregates["top_expensive_heap"], reverse=True)]
+
+def build_executive_summary(aggregates):
+    data = {"incident_index": aggregates["index"]}
+
+    # Collects Executive Summary data on the device with the most incidents
+    if aggregates["incidents_per_device"]:
+        most_incidents_device = max(aggregates["incidents_per_device"].items(), key=lambda x: x[1])
+        data["most_incidents_device_id"] = most_incidents_device[0]
+        data["most_incidents_device_count"] = most_incidents_device[1]
+    else:
+        data["most_incidents_device_id"] = "N/A"
+        data["most_incidents_device_count"] = 0
+
+    # Collects Executive Summary data on the most expensive incident
+    top_expensive_incidents = sorted_top_expensive(aggregates)
+    data["most_expensive_incident"] = top_expensive_incidents[0] if top_expensive_incidents else (None, 0)
+    data["highest_cost"] = format_ore(data["most_expensive_incident"][1]) if data["most_expensive_incident"][0] else "0,00"
+    data["most_expensive_ticket_id"] = data["most_expensive_incident"][0].ticket_id if data["most_expensive_incident"][0] else "N/A"
+    data["most_expensive_site"] = data["most_expensive_incident"][0].site if data["most_expensive_incident"][0] else "N/A"
+
+    # Collects Executive Summary data about sites with no critical incidents
+    data["sites_without_critical"] = aggregates["index"].sites_without_severity("critical", sorted(aggregates["sites"]))
+
+    # Counts the devices that were recurring problems up to last week and have had incidents
+    # this week. The flag only looks at the weeks before this one
+    current_week = aggregates["current_week"]
+    data["problem_devices_count"] = 0
+    for device_hostname in aggregates["recurrence"].devices:
+        incident_counts = aggregates["recurrence"].weekly(device_hostname, current_week)[0]
+        if incident_counts[-1] and is_recurring(incident_counts[:-1]):
+            data["problem_devices_count"] += 1
+
+    return data
+
+def build_severity_section(aggregates):
+    data = {
+        "severity_counts": aggregates["severity_counts"],
+        "formatted_severity_counts": {},
+        "severity_resolution_minutes": aggregates["severity_resolution_minutes"],
+        "unique_weeks": sorted(aggregates["unique_weeks"]),
+    }
+
+    # Adds formattting to sort severity and capitalie the first letters
+    for severity in severity_order:
+        count = data["severity_counts"].get(severity, 0)
+        formatted_severity = severity.capitalize()
+        data["formatted_severity_counts"][formatted_severity] = count
+
+    # Total cost formatted 
+    data["total_cost_formatted"] = format_ore(aggregates["total_cost_ore"])
+
+    # Counts average resolution time and resolution time percentiles of severity
+    data["avg_resolution_time"] = {}
+    data["resolution_time_percentiles"] = {}
+    for severity in severity_order:
+        count = data["severity_counts"].get(severity, 0)
+        if count:
+            avg_time = data["severity_resolution_minutes"][severity] / count
+            data["avg_resolution_time"][severity.capitalize()] = avg_time
+        else:
+            data["avg_resolution_time"][severity.capitalize()] = 0
+        sketch = aggregates["severity_resolution_sketches"].get(severity, QuantileSketch())
+        data["resolution_time_percentiles"][severity.capitalize()] = [sketch.quantile(q) for q in resolution_percentiles]
+
+    return data
+
+# Calculates average resolution time and resolution time percentiles per site
+def build_sites_section(aggregates):
+    for site_data in aggregates["sites"].values():
+        site_data["avg_resolution_time"] = site_data["resolution_minutes"] / site_data["incident_count"] if site_data["incident_count"] else 0
+        site_data["resolution_time_percentiles"] = [site_data["resolution_sketch"].quantile(q) for q in resolution_percentiles]
+
+    return {"sites": aggregates["sites"], "unique_sites": sorted(aggregates["sites"])}
+
+# Sorts high_impact_incidents with most affected users highest up on the list
+def build_high_impact_section(aggregates):
+    return {"high_impact_incidents": sorted(aggregates["high_impact_incidents"], key=lambda hi_imp: hi_imp.affected_users, reverse=True)}
+
+def build_top_expensive_section(aggregates):
+    return {"top_expensive_incidents": sorted_top_expensive(aggregates)}
+
+def build_categories_section(aggregates):
+    for category_data in aggregates["categories"].values():
+        category_data["avg_impact_score"] = category_data["total_impact"] / category_data["incident_count"] if category_data["incident_count"] else 0
+
+    return {"categories": aggregates["categories"]}
+
+# Calculates averages, last week warnings and the recurrence window of every device for the
+# problem_devices.csv report. Recurring devices are listed with the most incidents in the window first
+def build_devices_section(aggregates):
+    current_week = aggregates["current_week"]
+    recurrence = aggregates["recurrence"]
+
+    for device_hostname in aggregates["device_info"]:
+        device_data = aggregates["device_info"][device_hostname]
+
+        avg_severity_score = device_data["severity_score"] / device_data["incident_count"] if device_data["incident_count"] else 0
+        device_data["avg_severity_score"] = avg_severity_score
+
+        device_data["avg_affected_users"] = device_data["affected_users"] / device_data["affected_users_count"] if device_data["affected_users_count"] else 0
+
+        incident_counts, weekly_severity_scores, weekly_costs_ore = recurrence.weekly(device_hostname, current_week)
+        window_incident_count = sum(incident_counts)
+        device_data["window_incident_count"] = window_incident_count
+        device_data["window_active_weeks"] = sum(1 for count in incident_counts if count)
+        device_data["window_avg_severity_score"] = sum(weekly_severity_scores) / window_incident_count if window_incident_count else 0
+        device_data["window_total_cost_ore"] = sum(weekly_costs_ore)
+        device_data["incident_rate"] = incident_rate(incident_counts)
+        device_data["incident_trend"] = incident_trend(incident_counts)
+        device_data["recurring"] = is_recurring(incident_counts)
+        device_data["in_last_weeks_warnings"] = incident_counts[-2] > 0
+
+    recurring_devices = [device_hostname for device_hostname, device_data in aggregates["device_info"].items() if device_data["recurring"]]
+    recurring_devices.sort(key=lambda device_hostname: -aggregates["device_info"][device_hostname]["window_incident_count"])
+
+    return {
+        "device_info": aggregates["device_info"],
+        "recurring_devices": recurring_devices,
+        "recurrence_weeks": (current_week - recurrence.window_weeks + 1, current_week),
+        "incident_index": aggregates["index"],
+    }
+
+def build_weekly_costs_section(aggregates):
+    for week_number in aggregates["weekly_cost_analysis"]:
+        week_data = aggregates["weekly_cost_analysis"][week_number]
+        avg_impact_score = week_data["total_impact"] / week_data["incident_count"] if week_data["incident_count"] else 0
+        week_data["avg_impact_score"] = avg_impact_score
+
+    return {"weekly_cost_analysis": aggregates["weekly_cost_analysis"]}
+
+# Report sections with the function that builds them and the aggregate groups they need
+report_sections = {
+    "executive_summary": (build_executive_summary, ("weeks", "top_expensive", "sites", "index", "device_counts", "recurrence")),
+    "severity": (build_severity_section, ("totals", "weeks")),
+    "sites": (build_sites_section, ("sites",)),
+    "high_impact": (build_high_impact_section, ("high_impact",)),
+    "top_expensive": (build_top_expensive_section, ("top_expensive",)),
+    "categories": (build_categories_section, ("categories",)),
+    "devices": (build_devices_section, ("devices", "recurrence", "index", "weeks")),
+    "weekly_costs": (build_weekly_costs_section, ("weekly",)),
+}
+
+# Importable entry point that computes report sections lazily. Nothing is read until a
+# section is asked for, then only the aggregate groups it needs are computed and the
+# section is cached. Asking for several sections at once reads the input a single time
+class IncidentReport:
+
+    def __init__(self, network_incidents="network_incidents.csv", backend="python", workers=1, keep_tickets=False, cache_dir=None, recurrence_weeks=recurrence_window_weeks):
+        self.network_incidents = network_incidents
+        self.backend = backend
+        self.workers = workers
+        self.keep_tickets = keep_tickets
+        self.cache_dir = cache_dir
+        self.recurrence_weeks = recurrence_weeks
+        self.aggregates = None
+        self.data_quality_issues = DataQualityIssues()
+        self.sections = {}
+
+    def section(self, name):
+        if name not in self.sections:
+            self.load(report_sections[name][1])
+            if not self.aggregates["ticket_count"]:
+                raise ValueError("Inga giltiga rader kunde läsas in från CSV-filen.")
+            self.sections[name] = report_sections[name][0](self.aggregates)
+        return self.sections[name]
+
+    # Returns the data dict used by the writers, by default with every section
+    def data(self, *names):
+        names = names or tuple(report_sections)
+        self.load(section_groups(names))
+        if not self.aggregates["ticket_count"]:
+            data_quality_issues = self.data_quality_issues.copy()
+            data_quality_issues.add_message("Inga giltiga rader kunde läsas in från CSV-filen.")
+            return {"data_quality_issues": data_quality_issues}
+
+        data = {}
+        for name in names:
+            data.update(self.section(name))
+        data["data_quality_issues"] = self.data_quality_issues
+        return data
+
+    # Reads the input once for every group that hasn't been computed yet
+    def load(self, groups):
+        loaded_groups = self.aggregates["groups"] if self.aggregates is not None else ()
+        missing_groups = [group for group in groups if group not in loaded_groups]
+        if not missing_groups:
+            return
+
+        aggregates, data_quality_issues = aggregate_incidents(self.network_incidents, self.backend, self.workers, self.keep_tickets, missing_groups, self.cache_dir, recurrence_weeks=self.recurrence_weeks)
+        if self.aggregates is None:
+            self.aggregates = aggregates
+            self.data_quality_issues = data_quality_issues
+            return
+
+        # Groups never share state, so a later pass only adds its own keys
+        for key, value in aggregates.items():
+            if key not in ("ticket_count", "groups"):
+                self.aggregates[key] = value
+        self.aggregates["groups"] += tuple(missing_groups)
+
+    @property
+    def executive_summary(self):
+        return self.section("executive_summary")
+
+    def write_report(self, output_filename="incident_analysis.txt"):
+        write_incident_report(self.data(), output_filename)
+
+    def write_incidents_by_site(self, output_filename="incidents_by_site.csv"):
+        write_incidents_by_site_to_csv(self.data("sites"), output_filename)
+
+    def write_device_summary(self, output_filename="problem_devices.csv"):
+        write_device_summary_to_csv(self.data("devices"), output_filename)
+
+    def write_cost_analysis(self, output_filename="cost_analysis.csv"):
+        write_cost_analysis_to_csv(self.data("weekly_costs"), output_filename)
+
+# Maps the hostname prefix to a device type
+def device_type_from_hostname(device_hostname):
+    if device_hostname.startswith("SW-"):
+        return "Switch"
+    elif device_hostname.startswith("AP-"):
+        return "Access Point"
+    elif device_hostname.startswith("RT-"):
+        return "Router"
+    elif device_hostname.startswith("FW-"):
+        return "Firewall"
+    elif device_hostname.startswith("LB-"):
+        return "Load Balancer"
+    else:
+        return "Unknown"
+
+# NumPy backend: the tickets are loaded into typed columns and every aggregate is computed
+# with vectorized group-by reductions, filling the same running state as fold_ticket.
+# The index is still filled row by row while the columns are loaded
+
+# Reads the validated tickets into numeric arrays. Strings are dictionary encoded into
+# integer codes, numbered in the order they are first seen
+def load_incident_columns(network_incidents, data_quality_issues, index):
+    site_codes = {}
+    device_codes = {}
+    severity_codes = {}
+    category_codes = {}
+
+    ticket_ids = []
+    costs_sek = []
+    week_numbers = []
+    sites = []
+    devices = []
+    severities = []
+    categories = []
+    resolution_minutes = []
+    affected_users = []
+    costs_ore = []
+    impact_scores = []
+
+    for ticket in read_incident_records(network_incidents, data_quality_issues):
+        if index is not None:
+            index.add(ticket)
+        ticket_ids.append(ticket.ticket_id)
+        costs_sek.append(ticket.cost_sek)
+        week_numbers.append(ticket.week_number)
+        sites.append(site_codes.setdefault(ticket.site, len(site_codes)))
+        devices.append(-1 if ticket.device_hostname is None else device_codes.setdefault(ticket.device_hostname, len(device_codes)))
+        severities.append(severity_codes.setdefault(ticket.severity, len(severity_codes)))
+        categories.append(category_codes.setdefault(ticket.category, len(category_codes)))
+        resolution_minutes.append(ticket.resolution_minutes)
+        affected_users.append(-1 if ticket.affected_users is None else ticket.affected_users)
+        costs_ore.append(ticket.cost_ore)
+        impact_scores.append(ticket.impact_score)
+
+    return {
+        "ticket_id": ticket_ids,
+        "cost_sek": costs_sek,
+        "week_number": np.array(week_numbers, dtype=np.int32),
+        "site": np.array(sites, dtype=np.int32),
+        "device_hostname": np.array(devices, dtype=np.int32),
+        "severity": np.array(severities, dtype=np.int32),
+        "category": np.array(categories, dtype=np.int32),
+        "resolution_minutes": np.array(resolution_minutes, dtype=np.int64),
+        "affected_users": np.array(affected_users, dtype=np.int64),
+        "cost_ore": np.array(costs_ore, dtype=np.int64),
+        "impact_score": np.array(impact_scores, dtype=np.float64),
+        "site_names": list(site_codes),
+        "device_names": list(device_codes),
+        "severity_names": list(severity_codes),
+        "category_names": list(category_codes),
+    }
+
+# Builds the IncidentIndex for columns read from the column cache. The counts are computed
+# for all rows at once, keeping the tickets needs a record per row like the csv path
+def index_from_columns(columns, keep_tickets=False):
+    index = IncidentIndex(keep_tickets)
+    if keep_tickets:
+        for row in range(len(columns["cost_ore"])):
+            index.add(record_from_columns(columns, row))
+        return index
+
+    severity_count = len(columns["severity_names"])
+    site_severity_totals = np.bincount(columns["site"] * severity_count + columns["severity"], minlength=len(columns["site_names"]) * severity_count)
+    for code, site in enumerate(columns["site_names"]):
+        site_totals = site_severity_totals[code * severity_count:(code + 1) * severity_count]
+        index.site_severity_counts[site] = {severity: int(count) for severity, count in zip(columns["severity_names"], site_totals) if count}
+
+    device_rows = np.flatnonzero(columns["device_hostname"] >= 0)
+    device_weeks, counts = np.unique(columns["device_hostname"][device_rows].astype(np.int64) * 64 + columns["week_number"][device_rows], return_counts=True)
+    for device_hostname in columns["device_names"]:
+        index.device_week_counts[device_hostname] = {}
+    for device_week, count in zip(device_weeks.tolist(), counts.tolist()):
+        device_code, week_number = divmod(device_week, 64)
+        index.device_week_counts[columns["device_names"][device_code]][week_number] = count
+
+    return index
+
+# Splits values into one array per group code, keeping the original row order in each group
+def group_values(codes, values, group_count):
+    order = np.argsort(codes, kind="stable")
+    bounds = np.cumsum(np.bincount(codes, minlength=group_count))[:-1]
+    return np.split(values[order], bounds)
+
+# Sums int64 values per group code exactly, np.bincount would add them up as floats
+def group_sums(codes, values, group_count):
+    sums = np.zeros(group_count, dtype=np.int64)
+    np.add.at(sums, codes, values)
+    return sums
+
+# Builds a QuantileSketch from a column, adding every distinct value once with its count
+def sketch_from_values(values):
+    sketch = QuantileSketch()
+    distinct_values, counts = np.unique(values, return_counts=True)
+    for value, count in zip(distinct_values.tolist(), counts.tolist()):
+        sketch.add(value, count)
+    return sketch
+
+# Builds an IncidentRecord for a single row of the columns
+def record_from_columns(columns, row):
+    device_code = int(columns["device_hostname"][row])
+    device_hostname = columns["device_names"][device_code] if device_code >= 0 else None
+    affected_users = int(columns["affected_users"][row])
+
+    return IncidentRecord(
+        columns["ticket_id"][row],
+        int(columns["week_number"][row]),
+        columns["site_names"][columns["site"][row]],
+        device_hostname,
+        device_type_from_hostname(device_hostname) if device_hostname is not None else None,
+        columns["severity_names"][columns["severity"][row]],
+        columns["category_names"][columns["category"][row]],
+        int(columns["resolution_minutes"][row]),
+        affected_users if affected_users >= 0 else None,
+        columns["cost_sek"][row],
+        int(columns["cost_ore"][row]),
+        float(columns["impact_score"][row]),
+    )
+
+# Computes the same running state as fold_ticket, but for all columns at once and only
+# for the requested groups
+def aggregate_incident_columns(columns, index, groups=aggregate_groups, recurrence_weeks=recurrence_window_weeks):
+    aggregates = new_aggregates(groups=groups, recurrence_weeks=recurrence_weeks)
+    if index is not None:
+        aggregates["index"] = index
+
+    week_numbers = columns["week_number"]
+    sites = columns["site"]
+    devices = columns["device_hostname"]
+    severities = columns["severity"]
+    categories = columns["category"]
+    resolution_minutes = columns["resolution_minutes"]
+    affected_users = columns["affected_users"]
+    costs_ore = columns["cost_ore"]
+    impact_scores = columns["impact_score"]
+
+    site_count = len(columns["site_names"])
+    severity_count = len(columns["severity_names"])
+    category_count = len(columns["category_names"])
+    device_count = len(columns["device_names"])
+
+    aggregates["ticket_count"] = len(costs_ore)
+
+    # Counts, resolution times per severity and total cost
+    if "totals" in groups:
+        aggregates["total_cost_ore"] = int(costs_ore.sum())
+        severity_totals = np.bincount(severities, minlength=severity_count)
+        severity_resolution_times = group_values(severities, resolution_minutes, severity_count)
+        for code, severity in enumerate(columns["severity_names"]):
+            aggregates["severity_counts"][severity] = int(severity_totals[code])
+            aggregates["severity_resolution_minutes"][severity] = int(severity_resolution_times[code].sum())
+            aggregates["severity_resolution_sketches"][severity] = sketch_from_values(severity_resolution_times[code])
+
+    if "weeks" in groups:
+        aggregates["unique_weeks"] = set(np.unique(week_numbers).tolist())
+        aggregates["current_week"] = int(week_numbers.max())
+
+    # Incidents that affect more than 100 users, in file order
+    if "high_impact" in groups:
+        aggregates["high_impact_incidents"] = [record_from_columns(columns, row) for row in np.flatnonzero(affected_users > 100)]
+
+    # The 5 most expensive incidents, ties are won by the earliest ticket
+    if "top_expensive" in groups:
+        for row in np.argsort(-costs_ore, kind="stable")[:top_expensive_limit]:
+            aggregates["top_expensive_heap"].append((int(costs_ore[row]), -int(row), record_from_columns(columns, row)))
+
+    # Totals and weeks per site
+    if "sites" in groups:
+        site_totals = np.bincount(sites, minlength=site_count)
+        site_costs_ore = group_sums(sites, costs_ore, site_count)
+        site_resolution_times = group_values(sites, resolution_minutes, site_count)
+        site_weeks = group_values(sites, week_numbers, site_count)
+        for code, site in enumerate(columns["site_names"]):
+            aggregates["sites"][site] = {
+                "incident_count": int(site_totals[code]),
+                "total_cost_ore": int(site_costs_ore[code]),
+                "resolution_minutes": int(site_resolution_times[code].sum()),
+                "resolution_sketch": sketch_from_values(site_resolution_times[code]),
+                "weeks": set(np.unique(site_weeks[code]).tolist())
+            }
+
+    # Impact per category
+    if "categories" in groups:
+        category_totals = np.bincount(categories, minlength=category_count)
+        category_impacts = np.bincount(categories, weights=impact_scores, minlength=category_count)
+        for code, category in enumerate(columns["category_names"]):
+            aggregates["categories"][category]["incident_count"] = int(category_totals[code])
+            aggregates["categories"][category]["total_impact"] = float(category_impacts[code])
+
+    # Device statistics, only for tickets with a hostname
+    device_rows = np.flatnonzero(devices >= 0)
+    device_codes = devices[device_rows]
+    device_totals = np.bincount(device_codes, minlength=device_count)
+
+    if "device_counts" in groups:
+        for code, device_hostname in enumerate(columns["device_names"]):
+            aggregates["incidents_per_device"][device_hostname] = int(device_totals[code])
+
+    if "devices" in groups and device_count:
+        device_costs_ore = group_sums(device_codes, costs_ore[device_rows], device_count)
+        _, first_rows = np.unique(device_codes, return_index=True)
+        scores_by_severity = np.array([severity_scores.get(severity, 0) for severity in columns["severity_names"]], dtype=np.int64)
+        device_severity_scores = np.bincount(device_codes, weights=scores_by_severity[severities[device_rows]], minlength=device_count)
+        device_affected_users = affected_users[device_rows]
+        known_affected_users = device_affected_users >= 0
+        device_affected_users_totals = np.bincount(device_codes[known_affected_users], weights=device_affected_users[known_affected_users], minlength=device_count)
+        device_affected_users_counts = np.bincount(device_codes[known_affected_users], minlength=device_count)
+
+        for code, device_hostname in enumerate(columns["device_names"]):
+            aggregates["device_info"][device_hostname] = {
+                "site": columns["site_names"][sites[device_rows[first_rows[code]]]],
+                "device_type": device_type_from_hostname(device_hostname),
+                "incident_count": int(device_totals[code]),
+                "severity_score": int(device_severity_scores[code]),
+                "total_cost_ore": int(device_costs_ore[code]),
+                "affected_users": int(device_affected_users_totals[code]),
+                "affected_users_count": int(device_affected_users_counts[code])
+            }
+
+    # Incidents, severity scores and costs per device and week for the recurrence window.
+    # Weeks before the window of this file's latest week can't be in any later window
+    if "recurrence" in groups and len(device_rows):
+        window_weeks = aggregates["recurrence"].window_weeks
+        first_window_week = int(week_numbers.max()) - window_weeks + 1
+        window_rows = device_rows[week_numbers[device_rows] >= first_window_week]
+        pairs, pair_codes = np.unique(devices[window_rows].astype(np.int64) * window_weeks + (week_numbers[window_rows] - first_window_week), return_inverse=True)
+        pair_counts = np.bincount(pair_codes, minlength=len(pairs))
+        scores_by_severity = np.array([severity_scores.get(severity, 0) for severity in columns["severity_names"]], dtype=np.int64)
+        pair_severity_scores = np.bincount(pair_codes, weights=scores_by_severity[severities[window_rows]], minlength=len(pairs))
+        pair_costs_ore = group_sums(pair_codes, costs_ore[window_rows], len(pairs))
+        for pair, count, severity_score, cost_ore in zip(pairs.tolist(), pair_counts.tolist(), pair_severity_scores.tolist(), pair_costs_ore.tolist()):
+            device_code, week_offset = divmod(pair, window_weeks)
+            aggregates["recurrence"].add(columns["device_names"][device_code], first_window_week + week_offset, count, int(severity_score), cost_ore)
+
+    # Cost and impact per week, in the order the weeks first appear
+    if "weekly" in groups:
+        unique_weeks, first_rows = np.unique(week_numbers, return_index=True)
+        week_codes = np.searchsorted(unique_weeks, week_numbers)
+        week_totals = np.bincount(week_codes, minlength=len(unique_weeks))
+        week_costs_ore = group_sums(week_codes, costs_ore, len(unique_weeks))
+        week_impacts = np.bincount(week_codes, weights=impact_scores, minlength=len(unique_weeks))
+        for code in np.argsort(first_rows, kind="stable"):
+            aggregates["weekly_cost_analysis"][int(unique_weeks[code])] = {
+                "incident_count": int(week_totals[code]),
+                "total_cost_ore": int(week_costs_ore[code]),
+                "total_impact": float(week_impacts[code])
+            }
+
+    return aggregates
+
+
+# Week numbers are whole numbers from 1 to 53
+def parse_week_number(week_number):
+    week_number = int(week_number) if week_number.isdigit() else 0
+    if week_number < 1 or week_number > 53:
+        raise ValueError(f"Ogiltigt veckonummer: {week_number}")
+    return week_number
+
+# An empty affected_users means the number of affected users is unknown
+def parse_affected_users(affected_users):
+    return int(affected_users) if affected_users else None
+
+# Columns every row must have
+required_fields = ["ticket_id", "week_number", "site", "severity", "category", "resolution_minutes", "cost_sek", "impact_score"]
+
+# Values used for optional columns that are missing from the file
+optional_defaults = {"device_hostname": "N/A", "affected_users": "0"}
+
+# Validation rules in the order they are checked: rule name, field and the parser for the
+# field. A parser raises ValueError for a value that breaks the rule. compile_validator
+# turns these into the function that checks every row
+validation_rules = [
+    ("week_range", "week_number", parse_week_number),
+    ("swedish_cost", "cost_sek", parse_ore),
+    ("numeric_impact_score", "impact_score", float),
+    ("integer_resolution_minutes", "resolution_minutes", int),
+    ("integer_affected_users", "affected_users", parse_affected_users),
+]
+
+# How the rules are described in the report
+rule_descriptions = {
+    "required_fields": "Saknade obligatoriska fält",
+    "column_count": "För få kolumner i raden",
+    "week_range": "Ogiltigt veckonummer",
+    "swedish_cost": "Ogiltig kostnad",
+    "numeric_impact_score": "Ogiltig impact_score",
+    "integer_resolution_minutes": "Ogiltig resolution_minutes",
+    "integer_affected_users": "Ogiltigt antal affected_users",
+    "utf8_encoding": "Ogiltig UTF-8 i raden",
+    "csv_syntax": "Trasig CSV-rad",
+    "unknown_error": "Okänt fel vid läsning av rad",
+}
+
+# Formats percentiles like "45 / 120 / 310", rounded to whole minutes
+def format_percentiles(percentiles):
+    return " / ".join(f"{value:.0f}" for value in percentiles)
+
+# Writes the "Incident Analysis" text report
+def write_incident_report(data, output_filename="incident_analysis.txt"):
+    write_output(output_filename, render_incident_report(data))
+
+# Renders the text report in memory, it is written to the file in one go
+def render_incident_report(data):
+    report_file = io.StringIO()
+
+    # Adds static header to the report
+    report_file.write(f"="*35 + "\nIncident Analysis - Oktober 2025\n" + "="*35 + "\n")
+
+    # Adds Executive Summary to the report
+    report_file.write("\nEXECUTIVE SUMMARY\n-----------------\n")
+    report_file.write(f"⚠ KRITISKT: {data["most_incidents_device_id"]} har {data["most_incidents_device_count"]} incidenter\n")
+    report_file.write(f"⚠ KOSTNAD: Dyraste incident: {data["highest_cost"]} SEK ({data["most_expensive_ticket_id"]}, {data["most_expensive_site"]})\n")
+    report_file.write(f"⚠ {data["problem_devices_count"]} enheter från förra veckans \"problem devices\" har genererat incidents\n")
+
+    # Critical incident status message across all sites
+    if data["sites_without_critical"]:
+        message = f"✓ POSITIVT: Inga critical incidents på {", ".join(data["sites_without_critical"])}\n"
+    else:
+        message = "⚠ KRITISKT: Alla sites har critical incidents som behöver hanteras\n"
+    report_file.write(message)
+
+    # Writes Site and analysisperiod information from the data to the report
+    report_file.write("\nSITES OCH ANALYSVECKOR\n--------------------\n")
+    for site in data["unique_sites"]:
+        weeks = sorted(data["sites"][site]["weeks"])
+        report_file.write(f"Site: {site}\nAnalysveckor: v.{", v.".join(str(week) for week in weeks)}\n\n")
+
+    # Writes total amount of incidents per severity to the report
+    report_file.write("INCIDENTER PER SEVERITY-NIVÅ\n--------------------\n")
+    for severity, count in data["formatted_severity_counts"].items():
+        report_file.write(f"{severity.ljust(10)}-->   {count} incidents\n")
+
+    # Writes highest impact incidents to the report
+    report_file.write("\nINCIDENTER SOM PÅVERKAT FLER ÄN 100 ANVÄNDARE\n--------------------\n")
+    for ticket in data["high_impact_incidents"]:
+        report_file.write(f"Ticket ID: {ticket.ticket_id.ljust(15)} Site: {ticket.site.ljust(15)} Affected Users: {str(ticket.affected_users).ljust(5)}\n")
+
+    # Writes TOP 5 most expensive incidents to the report
+    report_file.write("\nDE 5 DYRASTE INCIDENTERNA\n--------------------\n")
+    for top_5, (ticket, cost_ore) in enumerate(data["top_expensive_incidents"], 1):
+        report_file.write(f"{top_5}. Ticket ID: {ticket.ticket_id.ljust(15)} Kostnad: {ticket.cost_sek.ljust(10)}SEK\n")
+
+    # Writes Total cost of incidents to the report
+    report_file.write("\nTOTALKOSTNAD FÖR INCIDENTER\n--------------------\n")
+    report_file.write(f"Totalkostnad: {data["total_cost_formatted"]} SEK\n")
+
+    # Writes average resolution time to the report
+    report_file.write("\nGENOMSNITTLIG RESOLUTION TIME PER SEVERITY-NIVÅ\n--------------------\n")
+    for severity, avg_time in data["avg_resolution_time"].items():
+        report_file.write(f"{severity.ljust(10)}-->   {avg_time:.2f} minuter\n")
+
+    # Writes resolution time percentiles to the report
+    report_file.write("\nRESOLUTION TIME PER SEVERITY-NIVÅ (p50 / p90 / p99)\n--------------------\n")
+    for severity, percentiles in data["resolution_time_percentiles"].items():
+        report_file.write(f"{severity.ljust(10)}-->   {format_percentiles(percentiles)} minuter\n")
+
+    # Writes Summary per site to the report
+    report_file.write("\nÖVERSIKT PER SITE\n--------------------\n")
+    for site in data ["unique_sites"]:
+        site_data = data["sites"][site]
+        report_file.write(f"{site}:\n")
+        report_file.write(f" Antal incidenter: {site_data["incident_count"]}\n")
+        report_file.write(f" Totalkostnad: {format_ore(site_data["total_cost_ore"])} SEK\n")
+        report_file.write(f" Genomsnittlig resolution tid: {site_data['avg_resolution_time']:.2f} minuter\n")
+        report_file.write(f" Resolution tid p50 / p90 / p99: {format_percentiles(site_data['resolution_time_percentiles'])} minuter\n\n")
+
+    # Writes Average Impact of Incidents to the report
+    report_file.write("INCIDENTS PER CATEGORY - GENOMSNITTLIG IMPACT\n--------------------\n")
+    report_file.write("Kategori      AVG Impact  Antal Incidenter\n")
+    for category, category_data in data["categories"].items():
+        formatted_category = category.capitalize()
+        report_file.write(f"{formatted_category.ljust(14)}{category_data['avg_impact_score']:.2f}        {category_data["incident_count"]}\n")
+
+    # Writes reccuring problematic devices to the report
+    report_file.write("\nENHETER MED ÅTERKOMMANDE PROBLEM\n--------------------\n")
+
+    # Devices flagged by the recurrence window, see is_recurring
+    first_week, last_week = data["recurrence_weeks"]
+    if data["recurring_devices"]:
+        for device_hostname in data["recurring_devices"]:
+            device_data = data["device_info"][device_hostname]
+            report_file.write(f"Enhet: {device_hostname}\n")
+            report_file.write(f" Typ: {device_data['device_type']}\n")
+            report_file.write(f" Antal incidenter: {device_data['incident_count']}\n")
+            report_file.write(f" Incidenter v.{first_week}-v.{last_week}: {device_data['window_incident_count']} under {device_data['window_active_weeks']} veckor, trend {device_data['incident_trend']:+.2f} per vecka\n")
+            report_file.write(f" Kostnad v.{first_week}-v.{last_week}: {format_ore(device_data['window_total_cost_ore'])} SEK, genomsnittlig allvarlighetsgrad {device_data['window_avg_severity_score']:.2f}\n")
+            report_file.write(f" Genomsnittlig allvarlighetsgrad: {device_data['avg_severity_score']:.2f}\n")
+            report_file.write(f" Genomsnittligt antal påverkade användare: {device_data['avg_affected_users']:.2f}\n")
+
+            if device_data["avg_severity_score"] > 3.0:
+                report_file.write(f" Föreslagna åtgärder: Utför en fullständig hälsokontroll, uppdatera hårdvara/mjukvara, övervaka noggrant.\n\n")
+            elif device_data["avg_affected_users"] > 50:
+                report_file.write(f" Föreslagna åtgärder: Utred orsaken till de många påverkade användarna, optimera nätverksinställningar.\n\n")
+            else:
+                report_file.write(f" Föreslagna åtgärder: Övervaka noggrant och utreda återkommande problem.\n\n")
+    else:
+        report_file.write("Inga enheter med återkommande problem identifierades.\n\n")
+
+    report_file.write("\nDATAKVALITETSPROBLEM\n-------------------\n")
+
+    # Counts per rule with a few example rows each, the full list is in the reject file
+    if "data_quality_issues" in data and data["data_quality_issues"]:
+        data_quality_issues = data["data_quality_issues"]
+        for rule, count in data_quality_issues.rule_counts.items():
+            report_file.write(f"⚠ {rule_descriptions.get(rule, rule)}: {count} rader\n")
+            for sample in data_quality_issues.samples.get(rule, []):
+                # Rules that concern the whole row have no field
+                field = f"{sample['field']} = " if sample["field"] is not None else ""
+                report_file.write(f"   {sample['source_file']} rad {sample['line_number']}: {field}\"{sample['value']}\"\n")
+        for message in data_quality_issues.messages:
+            report_file.write(f"⚠ {message}\n")
+    else:
+        report_file.write("Inga datakvalitetsproblem identifierades.\n")
+
+    return report_file.getvalue()
+
+# Formats a value with two decimals for the csv files
+def format_decimal(value):
+    return f"{value:.2f}"
+
+# Rows and columns of the tables written as csv, JSON Lines or npz, see report_export.py.
+# Costs are raw numbers in the rows and only formatted the Swedish way for csv
+def site_rows(data):
+    return [
+        {
+            "site": site,
+            "incident_count": data["sites"][site]["incident_count"],
+            "total_cost_ore": data["sites"][site]["total_cost_ore"],
+            "avg_resolution_minutes": data["sites"][site]["avg_resolution_time"],
+        }
+        for site in data["unique_sites"]
+    ]
+
+site_columns = [
+    ("site", "Site", None),
+    ("incident_count", "Antal Incidenter", None),
+    ("total_cost_ore", "Totalkostnad (SEK)", format_ore),
+    ("avg_resolution_minutes", "Genomsnittlig Resolution Tid (minuter)", format_decimal),
+]
+
+def device_rows(data):
+    return [
+        {
+            "device_hostname": device_hostname,
+            "site": device_data["site"],
+            "device_type": device_data["device_type"],
+            "incident_count": device_data["incident_count"],
+            "avg_severity_score": device_data["avg_severity_score"],
+            "total_cost_ore": device_data["total_cost_ore"],
+            "avg_affected_users": device_data["avg_affected_users"],
+            "in_last_weeks_warnings": device_data["in_last_weeks_warnings"],
+            "window_incident_count": device_data["window_incident_count"],
+            "window_active_weeks": device_data["window_active_weeks"],
+            "incident_trend": device_data["incident_trend"],
+            "window_total_cost_ore": device_data["window_total_cost_ore"],
+            "recurring": device_data["recurring"],
+        }
+        for device_hostname, device_data in data["device_info"].items()
+    ]
+
+device_columns = [
+    ("device_hostname", "device_hostname", None),
+    ("site", "site", None),
+    ("device_type", "device_type", None),
+    ("incident_count", "incident_count", None),
+    ("avg_severity_score", "avg_severity_score", format_decimal),
+    ("total_cost_ore", "total_cost_sek", format_ore),
+    ("avg_affected_users", "avg_affected_users", format_decimal),
+    ("in_last_weeks_warnings", "in_last_weeks_warnings", None),
+    ("window_incident_count", "window_incident_count", None),
+    ("window_active_weeks", "window_active_weeks", None),
+    ("incident_trend", "incident_trend", format_decimal),
+    ("window_total_cost_ore", "window_total_cost_sek", format_ore),
+    ("recurring", "recurring", None),
+]
+
+def week_rows(data):
+    return [
+        {
+            "week_number": week_number,
+            "total_cost_ore": data["weekly_cost_analysis"][week_number]["total_cost_ore"],
+            "avg_impact_score": data["weekly_cost_analysis"][week_number]["avg_impact_score"],
+        }
+        for week_number in sorted(data["weekly_cost_analysis"])
+    ]
+
+week_columns = [
+    ("week_number", "week_number", None),
+    ("total_cost_ore", "total_cost_sek", format_ore),
+    ("avg_impact_score", "avg_impact_score", format_decimal),
+]
+
+# Tables by output file name, with the function that builds their rows and their columns
+export_tables = {
+    "incidents_by_site": (site_rows, site_columns),
+    "problem_devices": (device_rows, device_columns),
+    "cost_analysis": (week_rows, week_columns),
+}
+
+# Output formats: the text report and the table formats of report_export.py
+export_formats = ["txt"] + list(table_formats)
+
+# Names of every file export_report can write
+output_filenames = {"incident_analysis.txt"} | {table + extension for table in export_tables for extension in table_formats.values()}
+
+# Renders and writes every output in the requested formats from one data dict. The rows
+# of a table are built once and shared by its formats. With more than one writer the
+# outputs are written in threads
+def export_report(data, formats=("txt", "csv"), writers=1, output_dir="."):
+    jobs = []
+    if "txt" in formats:
+        jobs.append(partial(write_incident_report, data, os.path.join(output_dir, "incident_analysis.txt")))
+
+    for table, (table_rows, columns) in export_tables.items():
+        table_formats_wanted = [table_format for table_format in table_formats if table_format in formats]
+        if not table_formats_wanted:
+            continue
+        rows = table_rows(data)
+        for table_format in table_formats_wanted:
+            output_filename = os.path.join(output_dir, table + table_formats[table_format])
+            jobs.append(partial(write_table, output_filename, columns, rows, table_format))
+
+    run_exports(jobs, writers)
+
+# CSV Writer that creates a csv file "incidents_by_site.csv" including Total Cost
+def write_incidents_by_site_to_csv(data, output_filename="incidents_by_site.csv"):
+    write_table(output_filename, site_columns, site_rows(data))
+
+# CSV Writer that creates a csv file "problem_devices.csv"
+def write_device_summary_to_csv(data, output_filename="problem_devices.csv"):
+    write_table(output_filename, device_columns, device_rows(data))
+
+# CSV Writer that creates a csv file "cost_analysis.csv"
+def write_cost_analysis_to_csv(data, output_filename="cost_analysis.csv"):
+    write_table(output_filename, week_columns, week_rows(data))
+
+
+# Command line entry point, also used by csv-reader.py
+# Parses a week range like "10-20" or a single week like "12" for --weeks
+def week_range(text):
+    first_week, _, last_week = text.partition("-")
+    try:
+        weeks = (int(first_week), int(last_week or first_week))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"ogiltigt veckointervall: {text}") from None
+    return weeks
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyserar nätverksincidenter och skriver rapport och CSV-filer.")
+    parser.add_argument("network_incidents", nargs="*", default=["network_incidents.csv"], help="CSV-filer, kataloger med CSV-filer eller glob-mönster")
+    parser.add_argument("--backend", choices=["python", "numpy"], default="python", help="Beräkna aggregaten i ren Python eller med NumPy")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Antal processer när flera filer läses in")
+    parser.add_argument("--incremental", action="store_true", help="Läs bara rader som lagts till sedan förra körningen")
+    parser.add_argument("--checkpoint", default="incident_analysis.checkpoint", help="Fil där aggregaten sparas i inkrementellt läge")
+    parser.add_argument("--cache", nargs="?", const=".incident_cache", help="Katalog där inlästa kolumner sparas så att CSV-filen inte tolkas om (kräver --backend numpy)")
+    parser.add_argument("--reject-file", help="CSV-fil som alla avvisade rader skrivs till")
+    parser.add_argument("--store", help="SQLite-databas med incidenthistorik, rapporten beräknas från databasen")
+    parser.add_argument("--ingest", action="store_true", help="Läs in CSV-filerna till --store före rapporten")
+    parser.add_argument("--weeks", type=week_range, help="Veckor i rapporten från --store, t.ex. 10-20 eller 12")
+    parser.add_argument("--site", action="append", dest="sites", help="Site i rapporten från --store, kan anges flera gånger")
+    parser.add_argument("--recurrence-weeks", type=int, default=recurrence_window_weeks, help=f"Antal veckor i fönstret som flaggar återkommande enheter (standard {recurrence_window_weeks}, minst 2)")
+    parser.add_argument("--format", action="append", choices=export_formats, dest="formats", help="Utdataformat, kan anges flera gånger (standard: txt och csv). jsonl och npz skrivs för tabellerna")
+    parser.add_argument("--writers", type=int, default=1, help="Antal trådar som skriver utdatafilerna")
+    parser.add_argument("--watch", action="store_true", help="Bevaka indata, skriv om rapporterna när rader tillkommer och servera JSON över HTTP")
+    parser.add_argument("--port", type=int, default=8765, help="Port på 127.0.0.1 för JSON i --watch-läge, 0 stänger av HTTP")
+    parser.add_argument("--interval", type=float, default=1.0, help="Sekunder mellan varje kontroll av indata i --watch-läge")
+    parser.add_argument("--debounce", type=float, default=2.0, help="Sekunder utan ändringar innan rapporterna skrivs i --watch-läge")
+    parser.add_argument("--metrics", nargs="?", const="incident_analysis.metrics.json", help="Skriv tid, minne och räknare per steg till en JSON-fil")
+    parser.add_argument("--profile", choices=["cprofile", "tracemalloc"], help="Profilera körningen, resultatet hamnar i metrics-filen (slår på --metrics)")
+    args = parser.parse_args(argv)
+
+    if args.cache and (args.backend != "numpy" or args.incremental):
+        parser.error("--cache fungerar bara med --backend numpy och utan --incremental")
+    if args.reject_file and args.incremental:
+        parser.error("--reject-file fungerar inte med --incremental")
+    if (args.ingest or args.weeks or args.sites) and not args.store:
+        parser.error("--ingest, --weeks och --site kräver --store")
+    if args.store and (args.incremental or args.cache or args.reject_file):
+        parser.error("--store kan inte kombineras med --incremental, --cache eller --reject-file")
+    if args.watch and (args.incremental or args.store or args.cache or args.reject_file or args.backend != "python"):
+        parser.error("--watch kan inte kombineras med --incremental, --store, --cache, --reject-file eller --backend numpy")
+    if args.recurrence_weeks < 2:
+        parser.error("--recurrence-weeks måste vara minst 2")
+    if args.formats is None:
+        args.formats = ["txt", "csv"]
+    if args.profile and not args.metrics:
+        args.metrics = "incident_analysis.metrics.json"
+    if args.metrics:
+        instrumentation.enable(args.profile)
+
+    if args.watch:
+        # Imported here because incident_watch is built on this module
+        from incident_watch import watch_incidents
+        watch_incidents(args.network_incidents, args.port or None, args.interval, args.debounce, args.formats, args.writers, args.recurrence_weeks)
+        if args.metrics:
+            instrumentation.active.write(args.metrics)
+            instrumentation.disable()
+        return
+
+    # Helps read and process the data
+    if args.incremental:
+        if len(args.network_incidents) != 1 or len(find_incident_files(args.network_incidents)) != 1:
+            parser.error("--incremental fungerar bara med en enda CSV-fil")
+        data = incremental_ticket_processor(args.network_incidents[0], args.checkpoint, args.recurrence_weeks)
+    elif args.store:
+        # Imported here because incident_store is built on this module
+        from incident_store import ingest_incidents, store_ticket_processor
+        try:
+            if args.ingest:
+                ingest_incidents(args.network_incidents, args.store)
+            data = store_ticket_processor(args.store, args.weeks, args.sites, recurrence_weeks=args.recurrence_weeks)
+        except ValueError as error:
+            parser.exit(1, f"{error}\n")
+    else:
+        data = ticket_processor(args.network_incidents, args.backend, args.workers, cache_dir=args.cache, reject_file=args.reject_file, recurrence_weeks=args.recurrence_weeks)
+
+    # Without a single valid ticket there is no report to write
+    if list(data) == ["data_quality_issues"]:
+        parser.exit(1, "".join(f"{message}\n" for message in data["data_quality_issues"].messages))
+
+    with instrumentation.active.stage("export"):
+        export_report(data, args.formats, args.writers)
+
+    if args.metrics:
+        instrumentation.active.write(args.metrics)
+        instrumentation.disable()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+import json
+import os
+import sqlite3
+
+import instrumentation
+from data_quality import DataQualityIssues
+from incident_analysis import (
+    IncidentIndex,
+    IncidentRecord,
+    QuantileSketch,
+    aggregate_groups,
+    build_report_data,
+    count_incidents,
+    find_incident_files,
+    new_aggregates,
+    read_incident_records,
+    recurrence_window_weeks,
+    report_sections,
+    section_groups,
+    severity_scores,
+    top_expensive_limit,
+)
+
+
+# SQLite store for incident history. Validated tickets from many csv files are kept in one
+# indexed table, and the report data is computed with SQL aggregate queries over any range
+# of weeks or set of sites, without reading the csv files again
+
+# Bumped whenever the schema changes, a store in another format has to be ingested again
+store_format = 2
+
+# Rows inserted per transaction while ingesting
+ingest_batch_size = 10000
+
+# Severity score of a row, the same weights as severity_scores
+severity_score_sql = "CASE severity " + " ".join(f"WHEN '{severity}' THEN {score}" for severity, score in severity_scores.items()) + " ELSE 0 END"
+
+# Columns in the same order as the IncidentRecord constructor, so a row becomes a record directly
+record_columns = ", ".join(IncidentRecord.__slots__)
+
+schema = """
+CREATE TABLE IF NOT EXISTS incidents (
+    id INTEGER PRIMARY KEY,
+    source_file TEXT NOT NULL,
+    ticket_id TEXT NOT NULL,
+    week_number INTEGER NOT NULL,
+    site TEXT NOT NULL,
+    device_hostname TEXT,
+    device_type TEXT,
+    severity TEXT NOT NULL,
+    category TEXT NOT NULL,
+    resolution_minutes INTEGER NOT NULL,
+    affected_users INTEGER,
+    cost_sek TEXT NOT NULL,
+    cost_ore INTEGER NOT NULL,
+    impact_score REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS incidents_week_number ON incidents (week_number);
+CREATE INDEX IF NOT EXISTS incidents_site ON incidents (site, week_number);
+CREATE INDEX IF NOT EXISTS incidents_device_hostname ON incidents (device_hostname, week_number);
+CREATE INDEX IF NOT EXISTS incidents_severity ON incidents (severity);
+CREATE INDEX IF NOT EXISTS incidents_source_file ON incidents (source_file);
+CREATE TABLE IF NOT EXISTS ingested_files (
+    source_file TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    ticket_count INTEGER NOT NULL,
+    data_quality_issues TEXT NOT NULL
+);
+"""
+
+
+def open_store(database):
+    connection = sqlite3.connect(database)
+    stored_format = connection.execute("PRAGMA user_version").fetchone()[0]
+    if stored_format != store_format and connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'incidents'").fetchone():
+        connection.close()
+        raise ValueError(f"{database} har ett äldre format, ta bort filen och läs in CSV-filerna igen med --ingest")
+    connection.execute(f"PRAGMA user_version = {store_format}")
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.execute("PRAGMA synchronous = NORMAL")
+    connection.executescript(schema)
+    return connection
+
+# Loads csv files (a file, a directory, a glob pattern or a list, like ticket_processor) into
+# the store. A file that is already stored with the same size and mtime is skipped, a file
+# that changed replaces its earlier rows. Returns the DataQualityIssues of the files read
+def ingest_incidents(network_incidents, database, batch_size=ingest_batch_size):
+    data_quality_issues = DataQualityIssues()
+    connection = open_store(database)
+    try:
+        for incident_file in find_incident_files(network_incidents):
+            with instrumentation.active.stage("ingest"):
+                data_quality_issues.merge(ingest_incident_file(connection, incident_file, batch_size))
+    finally:
+        connection.close()
+    return data_quality_issues
+
+def ingest_incident_file(connection, incident_file, batch_size):
+    source_file = os.path.abspath(incident_file)
+    status = os.stat(incident_file)
+    stored = connection.execute("SELECT size, mtime_ns, data_quality_issues FROM ingested_files WHERE source_file = ?", (source_file,)).fetchone()
+    if stored is not None and stored[:2] == (status.st_size, status.st_mtime_ns):
+        return DataQualityIssues.from_dict(json.loads(stored[2]), incident_file)
+
+    # The file is marked as ingested only after its last batch, so an interrupted run
+    # starts the file over next time
+    with connection:
+        connection.execute("DELETE FROM ingested_files WHERE source_file = ?", (source_file,))
+        connection.execute("DELETE FROM incidents WHERE source_file = ?", (source_file,))
+
+    data_quality_issues = DataQualityIssues(incident_file)
+    insert = f"INSERT INTO incidents (source_file, {record_columns}) VALUES ({', '.join('?' * (len(IncidentRecord.__slots__) + 1))})"
+    ticket_count = 0
+    batch = []
+    for ticket in read_incident_records(incident_file, data_quality_issues):
+        batch.append((source_file,) + tuple(getattr(ticket, field) for field in IncidentRecord.__slots__))
+        if len(batch) == batch_size:
+            with connection:
+                connection.executemany(insert, batch)
+            ticket_count += len(batch)
+            batch.clear()
+
+    with connection:
+        connection.executemany(insert, batch)
+        connection.execute(
+            "INSERT INTO ingested_files (source_file, size, mtime_ns, ticket_count, data_quality_issues) VALUES (?, ?, ?, ?, ?)",
+            (source_file, status.st_size, status.st_mtime_ns, ticket_count + len(batch), json.dumps(data_quality_issues.as_dict(), ensure_ascii=False)),
+        )
+
+    instrumentation.active.count("ingested_rows", ticket_count + len(batch))
+    return data_quality_issues
+
+# Returns the same data dict as ticket_processor, computed from the store for the given
+# weeks (a (first, last) pair, both included) and sites. The data quality issues are the
+# ones found when the stored files were ingested
+def store_ticket_processor(database, weeks=None, sites=None, keep_tickets=False, sections=None, recurrence_weeks=recurrence_window_weeks):
+    sections = list(report_sections) if sections is None else sections
+    connection = open_store(database)
+    try:
+        with instrumentation.active.stage("aggregate"):
+            aggregates = aggregate_store(connection, weeks, sites, keep_tickets, section_groups(sections), recurrence_weeks)
+            data_quality_issues = stored_data_quality_issues(connection)
+    finally:
+        connection.close()
+    count_incidents(aggregates, data_quality_issues)
+
+    if not aggregates["ticket_count"]:
+        data_quality_issues.add_message("Inga giltiga rader finns i databasen för det valda urvalet.")
+        return {"data_quality_issues": data_quality_issues}
+
+    with instrumentation.active.stage("build_report_data"):
+        data = build_report_data(aggregates, sections)
+    data["data_quality_issues"] = data_quality_issues
+    return data
+
+def stored_data_quality_issues(connection):
+    data_quality_issues = DataQualityIssues()
+    for source_file, issues in connection.execute("SELECT source_file, data_quality_issues FROM ingested_files ORDER BY source_file"):
+        data_quality_issues.merge(DataQualityIssues.from_dict(json.loads(issues), source_file))
+    return data_quality_issues
+
+# WHERE clause and parameters for a slice of the store
+def slice_filter(weeks, sites):
+    conditions = []
+    parameters = []
+    if weeks is not None:
+        conditions.append("week_number BETWEEN ? AND ?")
+        parameters.extend(weeks)
+    if sites:
+        conditions.append(f"site IN ({', '.join('?' * len(sites))})")
+        parameters.extend(sites)
+    return ("WHERE " + " AND ".join(conditions) if conditions else ""), parameters
+
+# Fills the same running state as fold_ticket with one grouped query per aggregate group.
+# Groups are listed in the order their first ticket was stored, like the csv path does
+def aggregate_store(connection, weeks=None, sites=None, keep_tickets=False, groups=aggregate_groups, recurrence_weeks=recurrence_window_weeks):
+    aggregates = new_aggregates(keep_tickets, groups, recurrence_weeks)
+    where, parameters = slice_filter(weeks, sites)
+    # Adds a condition to the slice filter
+    also = "AND" if where else "WHERE"
+
+    def query(sql):
+        return connection.execute(sql, parameters)
+
+    aggregates["ticket_count"] = query(f"SELECT COUNT(*) FROM incidents {where}").fetchone()[0]
+    if not aggregates["ticket_count"]:
+        return aggregates
+
+    if "totals" in groups:
+        aggregates["total_cost_ore"] = query(f"SELECT SUM(cost_ore) FROM incidents {where}").fetchone()[0]
+        for severity, count, resolution_minutes in query(f"SELECT severity, COUNT(*), SUM(resolution_minutes) FROM incidents {where} GROUP BY severity ORDER BY MIN(id)"):
+            aggregates["severity_counts"][severity] = count
+            aggregates["severity_resolution_minutes"][severity] = resolution_minutes
+        for severity, resolution_minutes, count in query(f"SELECT severity, resolution_minutes, COUNT(*) FROM incidents {where} GROUP BY severity, resolution_minutes"):
+            aggregates["severity_resolution_sketches"][severity].add(resolution_minutes, count)
+
+    if "weeks" in groups:
+        aggregates["unique_weeks"] = {week_number for week_number, in query(f"SELECT DISTINCT week_number FROM incidents {where}")}
+        aggregates["current_week"] = max(aggregates["unique_weeks"])
+
+    # Ties are won by the earliest stored ticket, like in the heap of the csv path
+    if "top_expensive" in groups:
+        for row in query(f"SELECT id, {record_columns} FROM incidents {where} ORDER BY cost_ore DESC, id LIMIT {top_expensive_limit}"):
+            aggregates["top_expensive_heap"].append((row[-2], -row[0], IncidentRecord(*row[1:])))
+
+    if "high_impact" in groups:
+        aggregates["high_impact_incidents"] = [IncidentRecord(*row) for row in query(f"SELECT {record_columns} FROM incidents {where} {also} affected_users > 100 ORDER BY id")]
+
+    if "sites" in groups:
+        for site, count, total_cost_ore, resolution_minutes in query(f"SELECT site, COUNT(*), SUM(cost_ore), SUM(resolution_minutes) FROM incidents {where} GROUP BY site ORDER BY MIN(id)"):
+            aggregates["sites"][site] = {"incident_count": count, "total_cost_ore": total_cost_ore, "resolution_minutes": resolution_minutes, "resolution_sketch": QuantileSketch(), "weeks": set()}
+        for site, week_number in query(f"SELECT DISTINCT site, week_number FROM incidents {where}"):
+            aggregates["sites"][site]["weeks"].add(week_number)
+        for site, resolution_minutes, count in query(f"SELECT site, resolution_minutes, COUNT(*) FROM incidents {where} GROUP BY site, resolution_minutes"):
+            aggregates["sites"][site]["resolution_sketch"].add(resolution_minutes, count)
+
+    if "index" in groups:
+        aggregates["index"] = store_index(query, where, also, keep_tickets)
+
+    if "device_counts" in groups:
+        for device_hostname, count in query(f"SELECT device_hostname, COUNT(*) FROM incidents {where} {also} device_hostname IS NOT NULL GROUP BY device_hostname ORDER BY MIN(id)"):
+            aggregates["incidents_per_device"][device_hostname] = count
+
+    # A bare column next to MIN(id) comes from the row with the lowest id, which gives the
+    # site of the first ticket of every device
+    if "devices" in groups:
+        known_affected_users = "affected_users IS NOT NULL AND affected_users >= 0"
+        device_query = f"""
+            SELECT device_hostname, site, device_type, MIN(id), COUNT(*), SUM({severity_score_sql}), SUM(cost_ore),
+                   TOTAL(CASE WHEN {known_affected_users} THEN affected_users END), COUNT(CASE WHEN {known_affected_users} THEN 1 END)
+            FROM incidents {where} {also} device_hostname IS NOT NULL
+            GROUP BY device_hostname ORDER BY MIN(id)
+        """
+        for device_hostname, site, device_type, _, count, severity_score_total, total_cost_ore, affected_users, affected_users_count in query(device_query):
+            aggregates["device_info"][device_hostname] = {
+                "site": site,
+                "device_type": device_type,
+                "incident_count": count,
+                "severity_score": severity_score_total,
+                "total_cost_ore": total_cost_ore,
+                "affected_users": int(affected_users),
+                "affected_users_count": affected_users_count
+            }
+
+    # Only the weeks in the window of the latest week of the slice
+    if "recurrence" in groups:
+        current_week = query(f"SELECT MAX(week_number) FROM incidents {where}").fetchone()[0]
+        first_window_week = current_week - aggregates["recurrence"].window_weeks + 1
+        recurrence_query = f"""
+            SELECT device_hostname, week_number, COUNT(*), SUM({severity_score_sql}), SUM(cost_ore)
+            FROM incidents {where} {also} device_hostname IS NOT NULL AND week_number >= {first_window_week}
+            GROUP BY device_hostname, week_number
+        """
+        for device_hostname, week_number, count, severity_score_total, total_cost_ore in query(recurrence_query):
+            aggregates["recurrence"].add(device_hostname, week_number, count, severity_score_total, total_cost_ore)
+
+    if "categories" in groups:
+        for category, count, total_impact in query(f"SELECT category, COUNT(*), TOTAL(impact_score) FROM incidents {where} GROUP BY category ORDER BY MIN(id)"):
+            aggregates["categories"][category]["incident_count"] = count
+            aggregates["categories"][category]["total_impact"] = total_impact
+
+    if "weekly" in groups:
+        for week_number, count, total_cost_ore, total_impact in query(f"SELECT week_number, COUNT(*), SUM(cost_ore), TOTAL(impact_score) FROM incidents {where} GROUP BY week_number ORDER BY MIN(id)"):
+            aggregates["weekly_cost_analysis"][week_number] = {"incident_count": count, "total_cost_ore": total_cost_ore, "total_impact": total_impact}
+
+    return aggregates
+
+# Builds the IncidentIndex from grouped counts, keeping the tickets loads every row of the slice
+def store_index(query, where, also, keep_tickets):
+    index = IncidentIndex(keep_tickets)
+    if keep_tickets:
+        for row in query(f"SELECT {record_columns} FROM incidents {where} ORDER BY id"):
+            index.add(IncidentRecord(*row))
+        return index
+
+    for site, severity, count in query(f"SELECT site, severity, COUNT(*) FROM incidents {where} GROUP BY site, severity ORDER BY MIN(id)"):
+        index.site_severity_counts.setdefault(site, {})[severity] = count
+    for device_hostname, week_number, count in query(f"SELECT device_hostname, week_number, COUNT(*) FROM incidents {where} {also} device_hostname IS NOT NULL GROUP BY device_hostname, week_number ORDER BY MIN(id)"):
+        index.device_week_counts.setdefault(device_hostname, {})[week_number] = count
+    return index
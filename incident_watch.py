@@ -0,0 +1,310 @@
+import copy
+import csv
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+import instrumentation
+from data_quality import DataQualityIssues
+from incident_analysis import (
+    build_report_data,
+    find_incident_files,
+    fold_ticket,
+    input_checksum,
+    input_tail,
+    new_aggregates,
+    export_report,
+    read_incident_records,
+    recurrence_window_weeks,
+    severity_order,
+    update_checksum,
+)
+
+
+# Long-running watch mode. The input files are polled and only the bytes added since the
+# last poll are parsed and folded into aggregates kept in memory. When the input has been
+# quiet for a moment the report and csv files are written again in a background thread,
+# and the current summary, sites and devices are served as JSON on a local HTTP port
+
+# Seconds between two looks at the input files
+watch_interval = 1.0
+
+# Seconds the input has to stay unchanged before the outputs are written
+watch_debounce = 2.0
+
+# Input that never stops changing still gets its outputs written this often
+watch_max_delay = 30.0
+
+# Errors that make a poll start over from scratch
+read_errors = (OSError, ValueError, csv.Error)
+
+http_host = "127.0.0.1"
+http_port = 8765
+
+
+# Keeps the aggregates of a set of input files up to date. Files are folded in the order
+# find_incident_files lists them, like a normal run. New rows at the end of the last file
+# and new files sorting after it are read incrementally, anything else (a file that was
+# rewritten, removed, or grew while a later file exists) rebuilds the state from scratch
+class IncidentWatcher:
+
+    # formats and writers are passed on to export_report for the output files,
+    # recurrence_weeks is the length of the recurrence window
+    def __init__(self, network_incidents, formats=("txt", "csv"), writers=1, recurrence_weeks=recurrence_window_weeks):
+        self.network_incidents = network_incidents
+        self.formats = formats
+        self.writers = writers
+        self.recurrence_weeks = recurrence_weeks
+        # Replaced as a whole after every rebuild, so the HTTP threads never see half of one
+        self.snapshot = None
+        self.reset()
+
+    def reset(self):
+        self.aggregates = new_aggregates(recurrence_weeks=self.recurrence_weeks)
+        # Read state per file in fold order: position, (size, mtime) when last read, a
+        # running checksum of the bytes read, their input_tail and the data quality issues found
+        self.files = {}
+
+    # Reads what was added since the last poll. Returns True if the input changed
+    def poll(self):
+        incident_files = [incident_file for incident_file in find_incident_files(self.network_incidents) if os.path.isfile(incident_file)]
+        changed = False
+        if not self.can_continue(incident_files):
+            self.reset()
+            changed = True
+
+        for number, incident_file in enumerate(incident_files):
+            status = os.stat(incident_file)
+            stamp = (status.st_size, status.st_mtime_ns)
+            state = self.files.get(incident_file)
+            if state is None:
+                state = self.files[incident_file] = {
+                    "position": {"offset": 0, "line_number": 0, "fieldnames": None},
+                    "stamp": None,
+                    "checksum": hashlib.sha256(),
+                    "tail": None,
+                    "complete": False,
+                    "data_quality_issues": DataQualityIssues(incident_file),
+                }
+            # A file followed by another one will not get more rows, so a last row without
+            # a newline is final and folded for good
+            complete = number < len(incident_files) - 1
+            if state["stamp"] == stamp and state["complete"] == complete:
+                continue
+
+            changed = True
+            state["stamp"] = stamp
+            state["complete"] = complete
+            position = state["position"]
+            position["unterminated"] = complete
+            start_offset = position["offset"]
+            with instrumentation.active.stage("watch_ingest"):
+                for ticket in read_incident_records(incident_file, state["data_quality_issues"], position):
+                    fold_ticket(self.aggregates, ticket)
+            update_checksum(state["checksum"], incident_file, start_offset, position["offset"])
+            state["tail"] = input_tail(incident_file, position["offset"])
+
+        return changed
+
+    # Whether the files can be read on from where the last poll stopped
+    def can_continue(self, incident_files):
+        read_files = list(self.files)
+        if incident_files[:len(read_files)] != read_files:
+            return False
+
+        for incident_file, state in self.files.items():
+            status = os.stat(incident_file)
+            if (status.st_size, status.st_mtime_ns) == state["stamp"]:
+                continue
+            offset = state["position"]["offset"]
+            if state["complete"] or status.st_size < offset:
+                return False
+            # A file that was only appended to passes the quick check, everything read
+            # is only checksummed again when it fails
+            if input_tail(incident_file, offset) != state["tail"] and input_checksum(incident_file, offset).digest() != state["checksum"].digest():
+                return False
+        return True
+
+    # Returns a copy of the aggregates and the data quality issues of everything read so
+    # far, which later polls do not touch. A last row that may still be being written is
+    # folded into the copy only
+    def current_state(self):
+        data_quality_issues = DataQualityIssues()
+        for state in self.files.values():
+            data_quality_issues.merge(state["data_quality_issues"])
+
+        aggregates = copy.deepcopy(self.aggregates)
+        if self.files:
+            last_file, state = next(reversed(self.files.items()))
+            if state["stamp"][0] > state["position"]["offset"]:
+                tail_issues = DataQualityIssues(last_file)
+                position = dict(state["position"], unterminated=True)
+                for ticket in read_incident_records(last_file, tail_issues, position):
+                    fold_ticket(aggregates, ticket)
+                data_quality_issues.merge(tail_issues)
+
+        return aggregates, data_quality_issues
+
+    # Builds the report data from a state returned by current_state, writes every output
+    # file and publishes the JSON snapshot
+    def regenerate(self, aggregates, data_quality_issues):
+        with instrumentation.active.stage("watch_regenerate"):
+            updated_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+            if not aggregates["ticket_count"]:
+                self.snapshot = {"updated_at": updated_at, "documents": None}
+                return
+
+            data = build_report_data(aggregates)
+            data["data_quality_issues"] = data_quality_issues
+            export_report(data, self.formats, self.writers)
+            self.snapshot = json_snapshot(data, aggregates, data_quality_issues, updated_at)
+
+    # Polls until interrupted. Outputs are written once the input has been unchanged for
+    # debounce seconds, or watch_max_delay after the first change that has not been written.
+    # Writing runs in a thread of its own so polling goes on meanwhile, a change that comes
+    # in while the outputs are written is written when that thread is done
+    def run(self, interval=watch_interval, debounce=watch_debounce):
+        first_change = last_change = None
+        export_thread = None
+        try:
+            while True:
+                now = time.monotonic()
+                try:
+                    if self.poll():
+                        last_change = now
+                        first_change = now if first_change is None else first_change
+                    due = last_change is not None and (now - last_change >= debounce or now - first_change >= watch_max_delay)
+                    if due and (export_thread is None or not export_thread.is_alive()):
+                        export_thread = threading.Thread(target=self.regenerate, args=self.current_state(), daemon=True)
+                        export_thread.start()
+                        first_change = last_change = None
+                except read_errors as error:
+                    # A file that disappeared or broke while it was read leaves the state half updated
+                    print(f"Kunde inte läsa indata, läser om allt: {error}", file=sys.stderr)
+                    self.reset()
+                    last_change = now
+                    first_change = now if first_change is None else first_change
+                time.sleep(interval)
+        finally:
+            # Outputs are replaced whole, but the last ones should still be finished
+            if export_thread is not None:
+                export_thread.join()
+
+# The JSON documents served over HTTP. They are encoded once per rebuild so a request
+# only has to send bytes
+def json_snapshot(data, aggregates, data_quality_issues, updated_at):
+    most_expensive_ticket, highest_cost = data["most_expensive_incident"]
+    summary = {
+        "updated_at": updated_at,
+        "ticket_count": aggregates["ticket_count"],
+        "rejected_rows": data_quality_issues.rejected_rows,
+        "total_cost_sek": aggregates["total_cost_ore"] / 100,
+        "severity_counts": {severity: data["severity_counts"].get(severity, 0) for severity in severity_order},
+        "most_incidents_device": {"device_hostname": data["most_incidents_device_id"], "incident_count": data["most_incidents_device_count"]},
+        "most_expensive_incident": {
+            "ticket_id": data["most_expensive_ticket_id"],
+            "site": data["most_expensive_site"],
+            "cost_sek": highest_cost / 100 if most_expensive_ticket else 0,
+        },
+        "sites_without_critical": data["sites_without_critical"],
+        "problem_devices_count": data["problem_devices_count"],
+        "recurring_devices": data["recurring_devices"],
+    }
+
+    sites = {}
+    for site in data["unique_sites"]:
+        site_data = data["sites"][site]
+        sites[site] = {
+            "incident_count": site_data["incident_count"],
+            "total_cost_sek": site_data["total_cost_ore"] / 100,
+            "avg_resolution_minutes": site_data["avg_resolution_time"],
+            "resolution_minutes_p50_p90_p99": site_data["resolution_time_percentiles"],
+            "weeks": sorted(site_data["weeks"]),
+        }
+
+    devices = {}
+    for device_hostname, device_data in data["device_info"].items():
+        devices[device_hostname] = {
+            "site": device_data["site"],
+            "device_type": device_data["device_type"],
+            "incident_count": device_data["incident_count"],
+            "avg_severity_score": device_data["avg_severity_score"],
+            "total_cost_sek": device_data["total_cost_ore"] / 100,
+            "avg_affected_users": device_data["avg_affected_users"],
+            "in_last_weeks_warnings": device_data["in_last_weeks_warnings"],
+            "window_incident_count": device_data["window_incident_count"],
+            "window_active_weeks": device_data["window_active_weeks"],
+            "incident_trend": device_data["incident_trend"],
+            "window_total_cost_sek": device_data["window_total_cost_ore"] / 100,
+            "recurring": device_data["recurring"],
+        }
+
+    documents = {"summary": summary, "sites": sites, "devices": devices}
+    return {
+        "updated_at": updated_at,
+        "documents": documents,
+        "encoded": {name: encode_json(document) for name, document in documents.items()},
+    }
+
+def encode_json(document):
+    return json.dumps(document, ensure_ascii=False).encode("utf-8")
+
+# Serves the latest snapshot of the watcher in server.watcher:
+#   /summary            executive summary
+#   /sites, /devices    all sites or devices
+#   /sites/<site>, /devices/<device_hostname>  a single one
+class SnapshotHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        snapshot = self.server.watcher.snapshot
+        if snapshot is None or snapshot["documents"] is None:
+            self.send_json(503, encode_json({"error": "Inga giltiga rader har lästs in än"}))
+            return
+
+        name, _, item = unquote(urlsplit(self.path).path).strip("/").partition("/")
+        documents = snapshot["documents"]
+        if name in documents and not item:
+            self.send_json(200, snapshot["encoded"][name])
+        elif name in ("sites", "devices") and item in documents[name]:
+            self.send_json(200, encode_json(documents[name][item]))
+        else:
+            self.send_json(404, encode_json({"error": f"Finns inte: {self.path}", "endpoints": ["/summary", "/sites", "/sites/<site>", "/devices", "/devices/<device_hostname>"]}))
+
+    def send_json(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Dashboards poll often, so requests are not logged
+    def log_message(self, format, *args):
+        pass
+
+# Watches the input until interrupted with Ctrl-C. With a port the snapshot is served on
+# http_host, a port of None serves nothing
+def watch_incidents(network_incidents, port=http_port, interval=watch_interval, debounce=watch_debounce, formats=("txt", "csv"), writers=1, recurrence_weeks=recurrence_window_weeks):
+    watcher = IncidentWatcher(network_incidents, formats, writers, recurrence_weeks)
+    server = None
+    if port is not None:
+        server = ThreadingHTTPServer((http_host, port), SnapshotHandler)
+        server.daemon_threads = True
+        server.watcher = watcher
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"Bevakar indata, JSON på http://{http_host}:{server.server_address[1]}/summary", file=sys.stderr)
+
+    try:
+        watcher.run(interval, debounce)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
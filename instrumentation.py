@@ -0,0 +1,173 @@
+import cProfile
+import json
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# Stage timers, counters and profiling hooks for incident_analysis.py. The module level
+# "active" object is what the analysis code talks to. By default it is DisabledMetrics,
+# whose methods do nothing, so instrumentation costs nothing unless enable() is called
+
+
+# Peak resident memory of the process so far, in bytes
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class DisabledMetrics:
+    enabled = False
+
+    def __init__(self):
+        self.null_stage = nullcontext()
+
+    def stage(self, name):
+        return self.null_stage
+
+    def count(self, name, value=1):
+        pass
+
+    def timed(self, iterable, name):
+        return iterable
+
+
+class Metrics:
+    enabled = True
+
+    # profile is None, "cprofile" or "tracemalloc"
+    def __init__(self, profile=None):
+        self.profile = profile
+        self.profiler = None
+        self.stages = {}
+        self.counters = defaultdict(int)
+        self.open_peaks = []
+        self.wall_start = None
+        self.cpu_start = None
+
+    def start(self):
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        if self.profile == "cprofile":
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        elif self.profile == "tracemalloc":
+            tracemalloc.start()
+
+    def stop(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+
+    # Times a block of work. Repeated stages with the same name are added up
+    @contextmanager
+    def stage(self, name):
+        if self.profile == "tracemalloc":
+            self.start_traced_peak()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            stage_data = self.stage_data(name)
+            stage_data["wall_seconds"] += time.perf_counter() - wall_start
+            stage_data["cpu_seconds"] += time.process_time() - cpu_start
+            stage_data["calls"] += 1
+            stage_data["peak_rss_bytes"] = peak_rss_bytes()
+            if self.profile == "tracemalloc":
+                stage_data["peak_traced_bytes"] = max(stage_data.get("peak_traced_bytes", 0), self.stop_traced_peak())
+
+    # tracemalloc has a single peak counter, so before a stage resets it the peak seen so
+    # far is handed to the stages that are still open around it
+    def start_traced_peak(self):
+        peak = tracemalloc.get_traced_memory()[1]
+        self.open_peaks = [max(open_peak, peak) for open_peak in self.open_peaks]
+        self.open_peaks.append(0)
+        tracemalloc.reset_peak()
+
+    def stop_traced_peak(self):
+        peak = max(self.open_peaks.pop(), tracemalloc.get_traced_memory()[1])
+        if self.open_peaks:
+            self.open_peaks[-1] = max(self.open_peaks[-1], peak)
+        return peak
+
+    def stage_data(self, name):
+        if name not in self.stages:
+            self.stages[name] = {"wall_seconds": 0.0, "cpu_seconds": 0.0, "calls": 0}
+        return self.stages[name]
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+
+    # Wraps an iterator and adds the time spent producing its items to a stage. Used to
+    # split reading and validation from the aggregation loop that consumes the items
+    def timed(self, iterable, name):
+        iterator = iter(iterable)
+        wall_clock = time.perf_counter
+        cpu_clock = time.process_time
+        stage_data = self.stage_data(name)
+        stage_data["calls"] += 1
+        while True:
+            wall_start = wall_clock()
+            cpu_start = cpu_clock()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                stage_data["wall_seconds"] += wall_clock() - wall_start
+                stage_data["cpu_seconds"] += cpu_clock() - cpu_start
+            yield item
+
+    # Writes all stages and counters to a JSON file. A cProfile run also gets a .prof file
+    # next to it that can be opened with pstats or snakeviz
+    def write(self, metrics_file):
+        self.stop()
+        metrics = {
+            "total_wall_seconds": time.perf_counter() - self.wall_start,
+            "total_cpu_seconds": time.process_time() - self.cpu_start,
+            "peak_rss_bytes": peak_rss_bytes(),
+            "stages": self.stages,
+            "counters": dict(self.counters),
+        }
+
+        if self.profiler is not None:
+            profile_file = metrics_file.rsplit(".", 1)[0] + ".prof"
+            self.profiler.dump_stats(profile_file)
+            metrics["profile"] = {"kind": "cprofile", "stats_file": profile_file}
+        elif self.profile == "tracemalloc":
+            top_allocations = tracemalloc.take_snapshot().statistics("lineno")[:15]
+            metrics["profile"] = {
+                "kind": "tracemalloc",
+                "top_allocations": [{"location": str(statistic.traceback), "size_bytes": statistic.size, "count": statistic.count} for statistic in top_allocations],
+            }
+            tracemalloc.stop()
+
+        with open(metrics_file, mode="w", encoding="utf-8") as file:
+            json.dump(metrics, file, indent=2)
+
+
+active = DisabledMetrics()
+
+
+# Turns instrumentation on for the rest of the run and returns the Metrics object
+def enable(profile=None):
+    global active
+    active = Metrics(profile)
+    active.start()
+    return active
+
+def disable():
+    global active
+    if active.enabled:
+        active.stop()
+    active = DisabledMetrics()
@@ -0,0 +1,70 @@
+import csv
+import io
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Output formats for the tables of incident_analysis.py. A table is a list of columns,
+# (key, csv header, function that formats a value for csv or None), and a list of rows
+# as dicts of raw values keyed by the column keys. Every format renders the same rows:
+#   csv    the files the report has always had, with Swedish number formatting
+#   jsonl  one JSON object per row with raw values
+#   npz    one compressed numpy array per column (numpy.load reads it back)
+# Every output is rendered in memory, written with one call to a temporary file next to
+# the target and renamed into place, so a reader never sees a half-written file
+
+# File extension of every table format
+table_formats = {"csv": ".csv", "jsonl": ".jsonl", "npz": ".npz"}
+
+
+def render_csv(columns, rows):
+    output = io.StringIO(newline="")
+    writer = csv.writer(output)
+    writer.writerow([header for _, header, _ in columns])
+    writer.writerows([[row[key] if csv_format is None else csv_format(row[key]) for key, _, csv_format in columns] for row in rows])
+    return output.getvalue()
+
+def render_jsonl(columns, rows):
+    return "".join(json.dumps({key: row[key] for key, _, _ in columns}, ensure_ascii=False) + "\n" for row in rows)
+
+def render_npz(columns, rows):
+    if np is None:
+        raise ImportError("npz-formatet kräver numpy (pip install numpy)")
+    output = io.BytesIO()
+    np.savez_compressed(output, **{key: np.array([row[key] for row in rows]) for key, _, _ in columns})
+    return output.getvalue()
+
+table_renderers = {"csv": render_csv, "jsonl": render_jsonl, "npz": render_npz}
+
+# Writes rendered text or bytes to output_filename through a temporary file. Text is
+# written with newline, "" keeps the line endings of csv
+def write_output(output_filename, content, newline=None):
+    temporary_file = f"{output_filename}.tmp"
+    if isinstance(content, bytes):
+        with open(temporary_file, mode="wb") as file:
+            file.write(content)
+    else:
+        with open(temporary_file, mode="w", encoding="utf-8", newline=newline) as file:
+            file.write(content)
+    os.replace(temporary_file, output_filename)
+
+def write_table(output_filename, columns, rows, table_format="csv"):
+    write_output(output_filename, table_renderers[table_format](columns, rows), newline="")
+
+# Runs export jobs, functions without arguments that render and write one output each.
+# With more than one writer the jobs run in threads, rendering holds the GIL but writing
+# and renaming the files overlap
+def run_exports(jobs, writers=1):
+    if writers > 1 and len(jobs) > 1:
+        with ThreadPoolExecutor(max_workers=writers) as executor:
+            for future in [executor.submit(job) for job in jobs]:
+                future.result()
+    else:
+        for job in jobs:
+            job()
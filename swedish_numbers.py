@@ -0,0 +1,42 @@
+# Swedish amounts like "4 567,50" as whole öre. Spaces, no-break spaces and narrow no-break
+# spaces group the thousands, a decimal comma or point is followed by at most two decimals
+# and a leading minus, a hyphen or U+2212, makes the amount negative. Amounts are kept as
+# int öre so sums over any number of tickets are exact
+
+# Thousands separators other than a plain space and the typographic minus sign
+separators = str.maketrans({"\u00a0": None, "\u202f": None, "\u2212": "-"})
+
+
+# Parses an amount into öre: "4 567,50" -> 456750, "-12,5" -> -1250, "300" -> 30000
+def parse_ore(text):
+    cleaned = text.replace(" ", "")
+
+    # Nearly every amount is kronor, a comma and two decimals, which without the comma is
+    # the öre as one int
+    if cleaned.find(",") == len(cleaned) - 3 > 0:
+        digits = cleaned.replace(",", "")
+        if digits.isascii() and digits.isdigit():
+            return int(digits)
+
+    if not cleaned.isascii():
+        cleaned = cleaned.translate(separators)
+        if not cleaned.isascii():
+            raise ValueError(f"ogiltigt belopp: {text!r}")
+
+    # The kronor and the decimals padded to two digits together are the öre
+    kronor, _, decimals = cleaned.replace(",", ".").partition(".")
+    if len(decimals) > 2:
+        raise ValueError(f"ogiltigt belopp: {text!r}")
+    digits = kronor + decimals.ljust(2, "0")
+
+    if kronor.isdigit() and digits.isdigit():
+        return int(digits)
+    if kronor[:1] in ("-", "+") and kronor[1:].isdigit() and digits[1:].isdigit():
+        return -int(digits[1:]) if kronor[0] == "-" else int(digits[1:])
+    raise ValueError(f"ogiltigt belopp: {text!r}")
+
+# Formats öre as an amount: 456750 -> "4 567,50"
+def format_ore(ore):
+    if ore < 0:
+        return "-" + format_ore(-ore)
+    return f"{ore // 100:_},{ore % 100:02}".replace("_", " ")
@@ -0,0 +1,132 @@
+import csv
+import re
+
+import pytest
+
+from generate_incidents import write_incidents_csv
+from incident_analysis import main
+from incident_watch import IncidentWatcher
+
+
+# Every way of running the analysis has to write byte-identical outputs for the same
+# input: sequential, parallel, numpy with and without the column cache, the SQLite
+# store, incremental runs over a growing file and the watcher. Run with python -m pytest
+
+# The files every run writes
+output_files = ["incident_analysis.txt", "incidents_by_site.csv", "problem_devices.csv", "cost_analysis.csv"]
+
+
+# A seeded file with broken rows and with every seventh description spanning two lines
+# inside quotes, the case that cuts a row in two when a file is read while it is written.
+# One row has a reporter in Latin-1 rather than UTF-8 and one a field over the csv
+# module's size limit, both are rejected the same way by every run mode
+@pytest.fixture
+def incidents(tmp_path):
+    generated = tmp_path / "generated.csv"
+    write_incidents_csv(generated, 3000, seed=7, site_count=8, devices_per_site=6, first_week=30, last_week=45, malformed_share=0.02)
+    with open(generated, encoding="utf-8", newline="") as file:
+        rows = list(csv.reader(file))
+    for row in rows[1::7]:
+        row[6] = row[6].replace(" ", "\n", 1)
+    rows[100][7] = "René Latin"
+    rows[200][12] = "x" * (csv.field_size_limit() + 1)
+
+    network_incidents = tmp_path / "network_incidents.csv"
+    with open(network_incidents, mode="w", encoding="utf-8", newline="") as file:
+        csv.writer(file).writerows(rows)
+    network_incidents.write_bytes(network_incidents.read_bytes().replace("René Latin".encode(), "René Latin".encode("latin-1")))
+    return network_incidents
+
+# Runs the command line in a directory of its own and returns the outputs
+def run_outputs(monkeypatch, directory, *arguments):
+    directory.mkdir(exist_ok=True)
+    monkeypatch.chdir(directory)
+    main([str(argument) for argument in arguments])
+    return read_outputs(directory)
+
+def read_outputs(directory):
+    return {output_file: (directory / output_file).read_bytes() for output_file in output_files}
+
+# Byte offsets to cut the file at: inside a quoted line break, in the middle of a line and
+# the end of the file
+def cut_offsets(network_incidents):
+    data = network_incidents.read_bytes()
+    quoted_line_break = data.index(b"\n", data.index(b'"', len(data) // 3))
+    while data.count(b'"', 0, quoted_line_break) % 2 == 0:
+        quoted_line_break = data.index(b"\n", data.index(b'"', quoted_line_break))
+    return data, [quoted_line_break + 1, len(data) // 2 + 17, len(data)]
+
+def test_single_file_paths_match(incidents, tmp_path, monkeypatch):
+    expected = run_outputs(monkeypatch, tmp_path / "sequential", incidents, "--workers", 1)
+    assert "Ogiltig UTF-8 i raden: 1 rader".encode() in expected["incident_analysis.txt"]
+    assert "Trasig CSV-rad: 1 rader".encode() in expected["incident_analysis.txt"]
+
+    assert run_outputs(monkeypatch, tmp_path / "store", incidents, "--store", tmp_path / "incidents.db", "--ingest") == expected
+
+    pytest.importorskip("numpy")
+    assert run_outputs(monkeypatch, tmp_path / "numpy", incidents, "--backend", "numpy") == expected
+    cache_dir = tmp_path / "cache"
+    assert run_outputs(monkeypatch, tmp_path / "cache_miss", incidents, "--backend", "numpy", "--cache", cache_dir) == expected
+    assert run_outputs(monkeypatch, tmp_path / "cache_hit", incidents, "--backend", "numpy", "--cache", cache_dir) == expected
+
+def test_parallel_matches_sequential(incidents, tmp_path, monkeypatch):
+    # Split as bytes at the end of every row, an even number of quotes, so the broken
+    # rows reach the parts unchanged
+    header, *lines = incidents.read_bytes().splitlines(keepends=True)
+    rows = [b""]
+    for line in lines:
+        rows[-1] += line
+        if rows[-1].count(b'"') % 2 == 0:
+            rows.append(b"")
+    parts = tmp_path / "parts"
+    parts.mkdir()
+    for number in range(4):
+        (parts / f"part_{number}.csv").write_bytes(header + b"".join(rows[number::4]))
+
+    expected = run_outputs(monkeypatch, tmp_path / "sequential", parts, "--workers", 1)
+    assert run_outputs(monkeypatch, tmp_path / "parallel", parts, "--workers", 4) == expected
+
+    pytest.importorskip("numpy")
+    assert run_outputs(monkeypatch, tmp_path / "numpy_parallel", parts, "--backend", "numpy", "--workers", 4) == expected
+
+def test_incremental_appends_match_full_run(incidents, tmp_path, monkeypatch):
+    data, offsets = cut_offsets(incidents)
+    growing = tmp_path / "growing.csv"
+    checkpoint = tmp_path / "incidents.checkpoint"
+    start = 0
+    for offset in offsets:
+        with open(growing, mode="ab") as file:
+            file.write(data[start:offset])
+        start = offset
+        incremental = run_outputs(monkeypatch, tmp_path / "incremental", growing, "--incremental", "--checkpoint", checkpoint)
+        assert incremental == run_outputs(monkeypatch, tmp_path / "full", growing, "--workers", 1)
+
+# A change to rows that were already read, even one that keeps the size, rebuilds the checkpoint
+def test_incremental_rebuilds_after_rewrite(incidents, tmp_path, monkeypatch):
+    checkpoint = tmp_path / "incidents.checkpoint"
+    run_outputs(monkeypatch, tmp_path / "incremental", incidents, "--incremental", "--checkpoint", checkpoint)
+
+    data = incidents.read_bytes()
+    cost = re.compile(rb',"(\d{1,3}) \d{3},\d\d"').search(data, len(data) // 2)
+    digit = cost.start(1)
+    incidents.write_bytes(data[:digit] + (b"8" if data[digit:digit + 1] == b"9" else b"9") + data[digit + 1:])
+
+    incremental = run_outputs(monkeypatch, tmp_path / "incremental", incidents, "--incremental", "--checkpoint", checkpoint)
+    assert incremental == run_outputs(monkeypatch, tmp_path / "full", incidents, "--workers", 1)
+
+def test_watch_matches_full_run(incidents, tmp_path, monkeypatch):
+    data, offsets = cut_offsets(incidents)
+    growing = tmp_path / "growing.csv"
+    watcher = IncidentWatcher(str(growing))
+    start = 0
+    for offset in offsets:
+        with open(growing, mode="ab") as file:
+            file.write(data[start:offset])
+        start = offset
+        watcher.poll()
+
+    watch_dir = tmp_path / "watch"
+    watch_dir.mkdir()
+    monkeypatch.chdir(watch_dir)
+    watcher.regenerate(*watcher.current_state())
+    assert read_outputs(watch_dir) == run_outputs(monkeypatch, tmp_path / "full", growing, "--workers", 1)
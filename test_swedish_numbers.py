@@ -0,0 +1,31 @@
+import pytest
+
+from swedish_numbers import format_ore, parse_ore
+
+
+@pytest.mark.parametrize("text, ore", [
+    ("18 945,75", 1894575),
+    ("4 567,50", 456750),
+    ("1 234 567,00", 123456700),
+    ("18\u00a0945,75", 1894575),
+    ("1\u202f234\u202f567,00", 123456700),
+    ("\u221212,50", -1250),
+    ("-12,5", -1250),
+    ("+12,50", 1250),
+    ("12,", 1200),
+    ("1234.50", 123450),
+    ("300", 30000),
+    ("0,05", 5),
+])
+def test_parse_ore(text, ore):
+    assert parse_ore(text) == ore
+
+@pytest.mark.parametrize("text", ["1e3", "12,345", "1,2,34", ",50", "-,50", "", "-", "1_000,00", "nan", "inf", "\u0661\u0662,\u0665\u0660", "12,5x", "--12,50"])
+def test_parse_ore_rejects(text):
+    with pytest.raises(ValueError):
+        parse_ore(text)
+
+@pytest.mark.parametrize("ore, text", [(1894575, "18 945,75"), (5, "0,05"), (-1250, "-12,50"), (123456700, "1 234 567,00"), (0, "0,00")])
+def test_format_ore(ore, text):
+    assert format_ore(ore) == text
+    assert parse_ore(text) == ore